@@ -0,0 +1,87 @@
+"""
+Simulates a chip: sets its inputs, runs the clock and prints its pins.
+"""
+import argparse
+import time
+
+from hdl_parser import HDLError
+from netlist import load_netlist
+from netlist_cache import NetlistCache
+from simulator import Simulator
+
+
+def _parse_assignment(assignment):
+    pin, value = assignment.split('=')
+    return pin, int(value, 0)
+
+
+def _load_hack(hack_filename):
+    return [int(line, 2) for line in open(hack_filename, 'rU')
+            if line.strip()]
+
+
+def _show(simulator, location):
+    name, address = location.rstrip(']').split('[')
+    models = simulator.builtin(name)
+    if not models:
+        raise HDLError('{} has no {} chip'.format(
+            simulator.netlist.name, name))
+    return models[0].words[int(address, 0)]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip())
+    arg_parser.add_argument('chip', help='.hdl file of the chip')
+    arg_parser.add_argument('--set', action='append', default=[],
+                            type=_parse_assignment, metavar='PIN=VALUE',
+                            help='set an input pin before running')
+    arg_parser.add_argument('--clock', type=int, default=0,
+                            help='clock cycles to run after setting the '
+                                 'inputs')
+    arg_parser.add_argument('--rom', metavar='HACK_FILE',
+                            help='program to load into the ROM32K chips')
+    arg_parser.add_argument('--show', action='append', default=[],
+                            metavar='CHIP[ADDRESS]',
+                            help='also print a word of a builtin memory '
+                                 'chip, such as Screen[0]')
+    arg_parser.add_argument('--gate-level', action='store_true',
+                            help='build the RAM, Register and PC parts '
+                                 'from their HDL instead of using their '
+                                 'fast models')
+    arg_parser.add_argument('--cache-dir',
+                            help='where flattened netlists are cached '
+                                 '(defaults to ~/.cache/hdl-netlists)')
+    arg_parser.add_argument('--no-cache', action='store_true',
+                            help='always build the netlist, without reading '
+                                 'or filling the cache')
+    args = arg_parser.parse_args()
+
+    start = time.time()
+    cache = None if args.no_cache else NetlistCache(args.cache_dir)
+    netlist = load_netlist(args.chip, not args.gate_level, cache)
+    simulator = Simulator(netlist)
+    print '{}: {} nets, {} Nand gates, {} DFFs, {} builtins in {:.2f} s'.format(
+        netlist.name, netlist.size, len(netlist.nand_out),
+        len(netlist.dff_out), len(netlist.builtins), time.time() - start)
+
+    if args.rom:
+        for rom in simulator.builtin('ROM32K'):
+            rom.load(_load_hack(args.rom))
+        simulator.reevaluate()
+    for pin, value in args.set:
+        simulator.set(pin, value)
+    simulator.eval()
+    start = time.time()
+    simulator.clock(args.clock)
+    if args.clock:
+        print '{} cycles in {:.3f} s'.format(args.clock, time.time() - start)
+
+    for pin, width in netlist.inputs + netlist.outputs:
+        value = simulator.get(pin)
+        print '{:>12} = {:>6} {:0{}b}'.format(pin, value, value, width)
+    for location in args.show:
+        value = _show(simulator, location)
+        print '{:>12} = {:>6} {:016b}'.format(location, value, value)
+
+
+main()
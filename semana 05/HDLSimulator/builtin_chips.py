@@ -0,0 +1,178 @@
+"""
+Python models of the chips the HDL files use without defining them.
+
+Nand and DFF are the primitives every netlist is made of. The other chips
+are behavioural: `evaluate` computes the outputs from the inputs as ints,
+`tick` samples the inputs listed in `clocked` and `tock` commits what tick
+sampled. Clocked inputs never reach the outputs in the same cycle, so they
+do not count as combinational paths.
+
+The fast models stand in for the course's own RAM, Register and PC chips
+when they are used as parts, so a Computer is not simulated down to the
+half a million DFFs of its RAM16K. `verify` checks them against the HDL.
+"""
+from array import array
+
+NAND = 'Nand'
+DFF = 'DFF'
+
+NAND_PINS = [('a', 1), ('b', 1)], [('out', 1)]
+DFF_PINS = [('in', 1)], [('out', 1)]
+
+
+class BuiltinChip(object):
+    inputs = []
+    outputs = []
+    clocked = ()
+
+    def evaluate(self, inputs):
+        """
+        Returns the values of `outputs` from the values of `inputs`, both
+        as lists of ints in pin order
+        """
+
+    def tick(self, inputs):
+        pass
+
+    def tock(self):
+        pass
+
+
+def memory_pins(address_width):
+    return [('in', 16), ('load', 1), ('address', address_width)]
+
+
+class Memory(BuiltinChip):
+    """
+    RAM read combinationally and written on the clock, with as many words
+    as its address pins can select
+    """
+    outputs = [('out', 16)]
+    clocked = ('in', 'load')
+
+    def __init__(self):
+        address_width = self.inputs[2][1]
+        self.words = array('H', [0]) * (1 << address_width)
+        self.pending = None
+
+    def evaluate(self, inputs):
+        return [self.words[inputs[2]]]
+
+    def tick(self, inputs):
+        value, load, address = inputs
+        self.pending = (address, value) if load else None
+
+    def tock(self):
+        if self.pending:
+            address, value = self.pending
+            self.words[address] = value
+            self.pending = None
+
+
+class Screen(Memory):
+    inputs = memory_pins(13)
+
+
+class RAM8(Memory):
+    inputs = memory_pins(3)
+
+
+class RAM64(Memory):
+    inputs = memory_pins(6)
+
+
+class RAM512(Memory):
+    inputs = memory_pins(9)
+
+
+class RAM4K(Memory):
+    inputs = memory_pins(12)
+
+
+class RAM16K(Memory):
+    inputs = memory_pins(14)
+
+
+class Register(BuiltinChip):
+    inputs = [('in', 16), ('load', 1)]
+    outputs = [('out', 16)]
+    clocked = ('in', 'load')
+
+    def __init__(self):
+        self.value = 0
+        self.pending = None
+
+    def evaluate(self, inputs):
+        return [self.value]
+
+    def tick(self, inputs):
+        value, load = inputs
+        self.pending = value if load else None
+
+    def tock(self):
+        if self.pending is not None:
+            self.value = self.pending
+            self.pending = None
+
+
+class PC(Register):
+    """
+    Program counter: reset wins over load, which wins over inc
+    """
+    inputs = [('in', 16), ('load', 1), ('inc', 1), ('reset', 1)]
+    clocked = ('in', 'load', 'inc', 'reset')
+
+    def tick(self, inputs):
+        value, load, inc, reset = inputs
+        if reset:
+            self.pending = 0
+        elif load:
+            self.pending = value
+        elif inc:
+            self.pending = (self.value + 1) & 0xFFFF
+        else:
+            self.pending = None
+
+
+class Keyboard(BuiltinChip):
+    """
+    `key` is the code of the key currently pressed, 0 for none
+    """
+    outputs = [('out', 16)]
+
+    def __init__(self):
+        self.key = 0
+
+    def evaluate(self, inputs):
+        return [self.key]
+
+
+class ROM32K(BuiltinChip):
+    inputs = [('address', 15)]
+    outputs = [('out', 16)]
+
+    def __init__(self):
+        self.words = array('H', [0]) * (1 << 15)
+
+    def load(self, rom):
+        self.words[:len(rom)] = array('H', rom)
+
+    def evaluate(self, inputs):
+        return [self.words[inputs[0]]]
+
+
+BUILTIN_CHIPS = {
+    'Keyboard': Keyboard,
+    'ROM32K': ROM32K,
+    'Screen': Screen
+}
+
+FAST_MODELS = {
+    'PC': PC,
+    'RAM8': RAM8,
+    'RAM64': RAM64,
+    'RAM512': RAM512,
+    'RAM4K': RAM4K,
+    'RAM16K': RAM16K,
+    'Register': Register
+}
@@ -0,0 +1,816 @@
+"""
+Compiles a chip into one straight-line Python function over int buses.
+
+The chip's HDL is expanded part by part, down to Nand gates and DFFs, into
+a graph of bitwise operations where every value is an int as wide as its
+bus. A run of parts of a chip whose pins are all one bit, wired to
+consecutive bits of the same buses, like the 16 Mux parts of Mux16, is
+expanded once with every value 16 bits wide, so the whole run costs the
+same few operations as one part. The graph is then simplified: Nand gates
+become and, or, xor and not, constants are folded, bits sliced out of a bus and
+put back together become the bus again, and DFFs that always load the same
+value share their state.
+
+The function takes the input pins as ints and returns the output pins. For
+chips with DFFs it also takes the `state` list, and returns the state after
+the next clock edge next to the outputs. Generated modules are cached on
+disk, keyed by the HDL files the chip is built from, so later runs skip
+parsing and code generation.
+"""
+import argparse
+import hashlib
+import imp
+import keyword
+import os
+import sys
+import tempfile
+
+from builtin_chips import DFF, NAND
+from hdl_parser import CONSTANTS, HDLError
+from netlist import library_for
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'hdl-codegen')
+
+# Part of the cache key: bump it whenever a change alters the code generated
+CODEGEN_VERSION = '1'
+
+# Chips that expand into more nodes than this, like the big RAMs, are left
+# to the netlist simulator
+MAX_NODES = 200000
+
+# Single-use expressions are written inside the expression that uses them,
+# up to this depth
+INLINE_DEPTH = 6
+
+
+def _mask(width):
+    return (1 << width) - 1
+
+
+class _Graph(object):
+    """
+    Hash-consed simplified nodes. A node is (kind, width, arguments...),
+    referred to by its index in `nodes`, and the constructors fold what they
+    can
+    """
+
+    def __init__(self):
+        self.nodes = []
+        self.index = {}
+
+    def add(self, *node):
+        if node not in self.index:
+            self.index[node] = len(self.nodes)
+            self.nodes.append(node)
+        return self.index[node]
+
+    def kind(self, node):
+        return self.nodes[node][0]
+
+    def width(self, node):
+        return self.nodes[node][1]
+
+    def const(self, width, value):
+        return self.add('const', width, value & _mask(width))
+
+    def value(self, node):
+        """
+        The value of a constant node, or None
+        """
+        if self.nodes[node][0] == 'const':
+            return self.nodes[node][2]
+        return None
+
+    def not_(self, x):
+        kind, width = self.nodes[x][:2]
+        if kind == 'const':
+            return self.const(width, ~self.value(x))
+        if kind == 'not':
+            return self.nodes[x][2]
+        if kind in ('and', 'or'):
+            a, b = self.nodes[x][2:]
+            if self.kind(a) == 'not' and self.kind(b) == 'not':
+                # De Morgan: Or and And built from Nand and Not
+                flipped = self.or_ if kind == 'and' else self.and_
+                return flipped(self.nodes[a][2], self.nodes[b][2])
+        return self.add('not', width, x)
+
+    def _complements(self, a, b):
+        return (self.kind(a) == 'not' and self.nodes[a][2] == b) or \
+            (self.kind(b) == 'not' and self.nodes[b][2] == a)
+
+    def and_(self, a, b):
+        width = self.width(a)
+        if self.value(a) is not None:
+            a, b = b, a
+        if self.value(b) == 0:
+            return b
+        if self.value(b) == _mask(width) or a == b:
+            return a
+        if self._complements(a, b):
+            return self.const(width, 0)
+        return self.add('and', width, min(a, b), max(a, b))
+
+    def or_(self, a, b):
+        width = self.width(a)
+        if self.value(a) is not None:
+            a, b = b, a
+        if self.value(b) == 0 or a == b:
+            return a
+        if self.value(b) == _mask(width):
+            return b
+        if self._complements(a, b):
+            return self.const(width, _mask(width))
+        xor = self._xor_operands(a, b)
+        if xor:
+            return self.add('xor', width, min(xor), max(xor))
+        return self.add('or', width, min(a, b), max(a, b))
+
+    def _xor_operands(self, a, b):
+        """
+        (x, y) when a | b is (x & ~y) | (~x & y), the shape of Xor.hdl
+        """
+        if self.kind(a) != 'and' or self.kind(b) != 'and':
+            return None
+        for x, not_y in (self.nodes[a][2:], self.nodes[a][:1:-1]):
+            if self.kind(not_y) != 'not':
+                continue
+            y = self.nodes[not_y][2]
+            if set(self.nodes[b][2:]) == set([y, self.not_(x)]):
+                return x, y
+        return None
+
+    def nand(self, a, b):
+        return self.not_(self.and_(a, b))
+
+    def slice(self, x, low, width):
+        node = self.nodes[x]
+        if node[0] == 'const':
+            return self.const(width, node[2] >> low)
+        if low == 0 and width == node[1]:
+            return x
+        if node[0] == 'bcast':
+            return self.broadcast(node[2], width)
+        if node[0] == 'slice':
+            return self.slice(node[2], node[3] + low, width)
+        if node[0] == 'cat':
+            pieces = [(piece, piece_low) for piece, piece_low in node[2]
+                      if piece_low < low + width and
+                      low < piece_low + self.width(piece)]
+            if not pieces:
+                return self.const(width, 0)
+            if len(pieces) == 1:
+                piece, piece_low = pieces[0]
+                if piece_low <= low and \
+                        low + width <= piece_low + self.width(piece):
+                    return self.slice(piece, low - piece_low, width)
+        return self.add('slice', width, x, low)
+
+    def broadcast(self, x, width):
+        """
+        `width` copies of the one bit value x
+        """
+        if width == 1:
+            return x
+        if self.value(x) is not None:
+            return self.const(width, -self.value(x))
+        return self.add('bcast', width, x)
+
+    def cat(self, pieces, width):
+        """
+        Puts (node, low bit) pieces together into a `width` bits value
+        """
+        constant = 0
+        merged = []
+        for piece, low in sorted(pieces, key=lambda piece: piece[1]):
+            value = self.value(piece)
+            if value is not None:
+                constant |= value << low
+                continue
+            # Consecutive slices of one value are that value's bits again
+            if merged and self.kind(piece) == 'slice' and \
+                    self.kind(merged[-1][0]) == 'slice':
+                last, last_low = merged[-1]
+                _, last_width, source, source_low = self.nodes[last]
+                _, piece_width, piece_source, piece_source_low = \
+                    self.nodes[piece]
+                if source == piece_source and \
+                        last_low + last_width == low and \
+                        source_low + last_width == piece_source_low:
+                    merged[-1] = (self.slice(source, source_low,
+                                             last_width + piece_width),
+                                  last_low)
+                    continue
+            merged.append((piece, low))
+
+        if constant:
+            merged.append((self.const(width, constant), 0))
+        if not merged:
+            return self.const(width, 0)
+        if len(merged) == 1 and merged[0][1] == 0:
+            piece = merged[0][0]
+            if self.width(piece) == width:
+                return piece
+        return self.add('cat', width, tuple(merged))
+
+
+class _Expander(object):
+    """
+    Expands a chip into raw nodes: lists like [kind, width, arguments...]
+    that may refer to wires before their parts are expanded. `simplify`
+    then turns them into `graph` nodes.
+    """
+
+    def __init__(self, library, name):
+        self.library = library
+        self.name = name
+        self.raw = []
+        self.state_widths = []
+        self.next_state = []
+        self.bitwise = {NAND: True, DFF: True}
+
+    def new(self, *node):
+        self.raw.append(list(node))
+        if len(self.raw) > MAX_NODES:
+            raise HDLError('{} is too big to compile'.format(self.name))
+        return len(self.raw) - 1
+
+    def definition(self, name):
+        definition = self.library.definition(name)
+        if definition is None or definition.builtin:
+            raise HDLError('{} is builtin and cannot be compiled'.format(
+                name))
+        return definition
+
+    def check(self, name):
+        """
+        Fails before expanding anything when some part of the chip is
+        builtin
+        """
+        pending = [name]
+        seen = set([NAND, DFF])
+        while pending:
+            name = pending.pop()
+            if name not in seen:
+                seen.add(name)
+                pending.extend(part for part, _ in
+                               self.definition(name).parts)
+
+    def pins(self, name):
+        if name == NAND:
+            return [('a', 1), ('b', 1)], [('out', 1)]
+        if name == DFF:
+            return [('in', 1)], [('out', 1)]
+        definition = self.definition(name)
+        return definition.inputs, definition.outputs
+
+    def is_bitwise(self, name):
+        """
+        Whether every pin of the chip and of all its parts is one bit, so it
+        works on as many independent lanes as its inputs have bits
+        """
+        if name not in self.bitwise:
+            self.bitwise[name] = False
+            inputs, outputs = self.pins(name)
+            self.bitwise[name] = all(width == 1 for _, width in
+                                     inputs + outputs) and \
+                all(self.is_bitwise(part)
+                    for part, _ in self.definition(name).parts)
+        return self.bitwise[name]
+
+    def expand(self, name, lanes, inputs):
+        """
+        Adds the nodes of chip `name` working on `lanes` lanes, where
+        `inputs` maps its input pins to nodes. Returns its output pins as
+        nodes
+        """
+        if name == NAND:
+            return {'out': self.new('nand', lanes, inputs['a'], inputs['b'])}
+        if name == DFF:
+            slot = len(self.state_widths)
+            self.state_widths.append(lanes)
+            self.next_state.append(inputs['in'])
+            return {'out': self.new('state', lanes, slot)}
+        return _ChipExpansion(self, self.definition(name), lanes,
+                              inputs).expand()
+
+
+class _ChipExpansion(object):
+
+    def __init__(self, expander, definition, lanes, inputs):
+        self.expander = expander
+        self.definition = definition
+        self.lanes = lanes
+        self.wires = dict(inputs)
+        self.pieces = {}
+        for pin, width in definition.outputs:
+            self._wire(pin, width)
+
+    def error(self, message):
+        return HDLError('{}: {}'.format(self.definition.name, message))
+
+    def _wire(self, wire, width):
+        if wire not in self.wires:
+            self.wires[wire] = self.expander.new('wire', width * self.lanes,
+                                                 None)
+            self.pieces[wire] = []
+        return self.wires[wire]
+
+    def _source(self, wire, bits, width):
+        """
+        Node of `width` bits read from `wire`, or from `bits` of it
+        """
+        new = self.expander.new
+        if wire in CONSTANTS:
+            return new('const', width * self.lanes,
+                       _mask(width * self.lanes) if wire == 'true' else 0)
+        if wire not in self.wires:
+            if bits:
+                raise self.error('sub bus of unknown wire {}'.format(wire))
+            self._wire(wire, width)
+        node = self.wires[wire]
+        if bits:
+            return new('slice', width * self.lanes, node,
+                       bits[0] * self.lanes)
+        return node
+
+    def _groups(self):
+        """
+        Splits the parts into runs that can be expanded together, as
+        (chip name, list of connection lists)
+        """
+        parts = self.definition.parts
+        position = 0
+        while position < len(parts):
+            name, connections = parts[position]
+            end = position + 1
+            if self.lanes == 1 and self.expander.is_bitwise(name):
+                while end < len(parts) and parts[end][0] == name and \
+                        self._lane_of(name, connections, parts[end][1],
+                                      end - position):
+                    end += 1
+                if end - position > 1 and not self._reads_own_output(
+                        parts[position:end]):
+                    yield name, [part[1] for part in parts[position:end]]
+                    position = end
+                    continue
+            yield name, [connections]
+            position += 1
+
+    def _lane_of(self, name, first, other, lane):
+        """
+        Whether the `other` part is lane `lane` of a run starting with the
+        `first` part: the same pins, each input wired either to the same
+        wire as in the first part or to the bit `lane` places above, and
+        each output to the bit `lane` places above
+        """
+        if len(first) != len(other):
+            return False
+        inputs = set(pin for pin, _ in self.expander.pins(name)[0])
+        for (pin, pin_bits, wire, bits), (other_pin, other_pin_bits,
+                                          other_wire, other_bits) in \
+                zip(first, other):
+            if pin != other_pin or pin_bits or other_pin_bits or \
+                    wire != other_wire:
+                return False
+            if bits == other_bits and pin in inputs:
+                continue
+            if bits is None or other_bits is None or \
+                    bits[0] != bits[1] or other_bits[0] != other_bits[1] or \
+                    other_bits[0] != bits[0] + lane:
+                return False
+        return True
+
+    def _reads_own_output(self, run):
+        inputs, _ = self.expander.pins(run[0][0])
+        input_pins = set(pin for pin, _ in inputs)
+        outputs = set(wire for _, connections in run
+                      for pin, _, wire, _ in connections
+                      if pin not in input_pins)
+        return any(wire in outputs for _, connections in run
+                   for pin, _, wire, _ in connections
+                   if pin in input_pins)
+
+    def _run_inputs(self, name, runs):
+        """
+        Input nodes of a run of one bit parts expanded together: each pin
+        is the bits its lanes read, or one bit copied to every lane
+        """
+        new = self.expander.new
+        lanes = len(runs)
+        inputs, _ = self.expander.pins(name)
+        values = dict((pin, new('const', lanes, 0)) for pin, _ in inputs)
+        for (pin, _, wire, bits), (_, _, _, last_bits) in zip(runs[0],
+                                                             runs[-1]):
+            if pin not in values:
+                continue
+            if bits != last_bits:
+                values[pin] = self._source(
+                    wire, (bits[0], bits[0] + lanes - 1), lanes)
+            else:
+                values[pin] = new('bcast', lanes,
+                                  self._source(wire, bits, 1))
+        return values
+
+    def _part_inputs(self, name, connections):
+        new = self.expander.new
+        inputs, outputs = self.expander.pins(name)
+        pieces = dict((pin, []) for pin, _ in inputs)
+        widths = dict(inputs)
+        for pin, pin_bits, wire, bits in connections:
+            if pin not in pieces:
+                if pin not in dict(outputs):
+                    raise self.error('{} has no pin {}'.format(name, pin))
+                continue
+            low, high = pin_bits or (0, widths[pin] - 1)
+            source = self._source(wire, bits, high - low + 1)
+            pieces[pin].append((source, low * self.lanes))
+        return dict((pin, new('cat', widths[pin] * self.lanes,
+                              pieces[pin])) for pin in pieces)
+
+    def expand(self):
+        expander = self.expander
+        for name, runs in self._groups():
+            _, outputs = expander.pins(name)
+            widths = dict(outputs)
+            if len(runs) > 1:
+                lanes = len(runs)
+                values = expander.expand(name, lanes,
+                                         self._run_inputs(name, runs))
+                for pin, _, wire, bits in runs[0]:
+                    if pin in widths:
+                        if wire not in self.pieces:
+                            raise self.error('sub bus of unknown wire '
+                                             '{}'.format(wire))
+                        self.pieces[wire].append((values[pin], bits[0]))
+                continue
+
+            connections = runs[0]
+            values = expander.expand(name, self.lanes,
+                                     self._part_inputs(name, connections))
+            for pin, pin_bits, wire, bits in connections:
+                if pin not in widths:
+                    continue
+                if wire in CONSTANTS:
+                    raise self.error('output {}.{} is connected to {}'.format(
+                        name, pin, wire))
+                low, high = pin_bits or (0, widths[pin] - 1)
+                width = high - low + 1
+                value = values[pin]
+                if pin_bits:
+                    value = expander.new('slice', width * self.lanes, value,
+                                         low * self.lanes)
+                self._wire(wire, width)
+                self.pieces[wire].append(
+                    (value, bits[0] * self.lanes if bits else 0))
+
+        for wire, pieces in self.pieces.items():
+            node = self.wires[wire]
+            expander.raw[node][2] = expander.new(
+                'cat', expander.raw[node][1], pieces)
+        return dict((pin, self.wires[pin])
+                    for pin, _ in self.definition.outputs)
+
+
+class _Simplifier(object):
+    """
+    Turns raw nodes into graph nodes, reading the state slots merged into
+    others through `aliases`
+    """
+
+    def __init__(self, raw, aliases):
+        self.raw = raw
+        self.aliases = aliases
+        self.graph = _Graph()
+        self.done = {}
+        self.visiting = set()
+
+    def simplify(self, node):
+        if node in self.done:
+            return self.done[node]
+        if node in self.visiting:
+            raise HDLError('combinational loop')
+        self.visiting.add(node)
+        graph = self.graph
+        raw = self.raw[node]
+        kind, width = raw[:2]
+        if kind == 'const':
+            result = graph.const(width, raw[2])
+        elif kind == 'input':
+            result = graph.add('input', width, raw[2])
+        elif kind == 'state':
+            result = graph.add('state', width,
+                               self.aliases.get(raw[2], raw[2]))
+        elif kind == 'nand':
+            result = graph.nand(self.simplify(raw[2]), self.simplify(raw[3]))
+        elif kind == 'slice':
+            result = graph.slice(self.simplify(raw[2]), raw[3], width)
+        elif kind == 'bcast':
+            result = graph.broadcast(self.simplify(raw[2]), width)
+        elif kind == 'cat':
+            result = graph.cat([(self.simplify(piece), low)
+                                for piece, low in raw[2]], width)
+        else:
+            result = self.simplify(raw[2])
+        self.visiting.remove(node)
+        self.done[node] = result
+        return result
+
+
+class _Writer(object):
+    """
+    Writes graph nodes as Python expressions, giving a variable to every
+    node used more than once
+    """
+
+    def __init__(self, graph, roots, state_names):
+        self.graph = graph
+        self.state_names = state_names
+        self.uses = {}
+        self.names = {}
+        self.lines = []
+        for root in roots:
+            self._count(root)
+        for root in roots:
+            self.uses[root] = self.uses.get(root, 0) + 1
+
+    def _count(self, root):
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            self.uses[node] = self.uses.get(node, 0) + 1
+            if self.uses[node] == 1:
+                stack.extend(self._arguments(node))
+
+    def _arguments(self, node):
+        kind = self.graph.nodes[node][0]
+        arguments = self.graph.nodes[node][2:]
+        if kind in ('not', 'bcast'):
+            return [arguments[0]]
+        if kind in ('and', 'or', 'xor'):
+            return list(arguments)
+        if kind == 'slice':
+            return [arguments[0]]
+        if kind == 'cat':
+            return [piece for piece, _ in arguments[0]]
+        return []
+
+    def name(self, node):
+        """
+        Expression for `node`, writing out the variables it needs first
+        """
+        expression, _ = self._expression(node, 0)
+        return expression
+
+    def _operand(self, node, depth):
+        expression, simple = self._expression(node, depth + 1)
+        return expression if simple else '(' + expression + ')'
+
+    def _expression(self, node, depth):
+        """
+        Returns (expression, whether it needs no parentheses)
+        """
+        if node in self.names:
+            return self.names[node], True
+        kind, width = self.graph.nodes[node][:2]
+        arguments = self.graph.nodes[node][2:]
+        if kind == 'const':
+            return str(arguments[0]), True
+        if kind == 'input':
+            return _parameter(arguments[0]), True
+        if kind == 'state':
+            return self.state_names[arguments[0]], True
+
+        inline = self.uses.get(node, 0) <= 1 and depth < INLINE_DEPTH
+        operand_depth = depth if inline else 0
+        mask = hex(_mask(width)).rstrip('L')
+        if kind == 'not':
+            expression = '~{} & {}'.format(
+                self._operand(arguments[0], operand_depth), mask)
+        elif kind in ('and', 'or', 'xor'):
+            operator = {'and': ' & ', 'or': ' | ', 'xor': ' ^ '}[kind]
+            expression = operator.join(
+                self._operand(argument, operand_depth)
+                for argument in arguments)
+        elif kind == 'slice':
+            source, low = arguments
+            expression = self._operand(source, operand_depth)
+            if low:
+                expression += ' >> {}'.format(low)
+            expression += ' & ' + mask
+        elif kind == 'bcast':
+            expression = '-{} & {}'.format(
+                self._operand(arguments[0], operand_depth), mask)
+        else:
+            terms = []
+            for piece, low in arguments[0]:
+                term = self._operand(piece, operand_depth)
+                terms.append(term + ' << {}'.format(low) if low else term)
+            expression = ' | '.join(terms)
+
+        if inline:
+            return expression, False
+        variable = 't{}'.format(len(self.names))
+        self.lines.append('    {} = {}'.format(variable, expression))
+        self.names[node] = variable
+        return variable, True
+
+
+def _parameter(pin):
+    return pin + '_' if keyword.iskeyword(pin) else pin
+
+
+def _expand(library, name):
+    """
+    Returns (definition, simplifier, output nodes, next state nodes, slot
+    of each state) after merging the DFFs that load the same value
+    """
+    expander = _Expander(library, name)
+    expander.check(name)
+    definition = expander.definition(name)
+    inputs = dict((pin, expander.new('input', width, pin))
+                  for pin, width in definition.inputs)
+    outputs = expander.expand(name, 1, inputs)
+
+    aliases = {}
+    while True:
+        simplifier = _Simplifier(expander.raw, aliases)
+        output_nodes = [simplifier.simplify(outputs[pin])
+                        for pin, _ in definition.outputs]
+        next_nodes = {}
+        merged = False
+        for slot, node in enumerate(expander.next_state):
+            if slot in aliases:
+                continue
+            value = (expander.state_widths[slot], simplifier.simplify(node))
+            if value in next_nodes:
+                aliases[slot] = next_nodes[value]
+                merged = True
+            else:
+                next_nodes[value] = slot
+        if not merged:
+            break
+        for slot in aliases:
+            while aliases[slot] in aliases:
+                aliases[slot] = aliases[aliases[slot]]
+
+    slots = sorted(slot for slot in range(len(expander.next_state))
+                   if slot not in aliases)
+    next_state = [simplifier.simplify(expander.next_state[slot])
+                  for slot in slots]
+    return definition, simplifier, output_nodes, next_state, slots
+
+
+def generate(hdl_filename):
+    """
+    Returns the source of the Python module computing the chip
+    """
+    name = os.path.splitext(os.path.basename(hdl_filename))[0]
+    library = library_for(hdl_filename)
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 20000))
+    definition, simplifier, outputs, next_state, slots = _expand(library,
+                                                                 name)
+    state_names = dict((slot, 's{}'.format(index))
+                       for index, slot in enumerate(slots))
+    writer = _Writer(simplifier.graph, outputs + next_state, state_names)
+    output_expressions = [writer.name(node) for node in outputs]
+    next_expressions = [writer.name(node) for node in next_state]
+
+    parameters = [_parameter(pin) for pin, _ in definition.inputs]
+    lines = [
+        '"""',
+        'Generated from {} by codegen.py, do not edit.'.format(
+            os.path.basename(hdl_filename)),
+        '"""',
+        'NAME = {!r}'.format(name),
+        'INPUTS = {!r}'.format(definition.inputs),
+        'OUTPUTS = {!r}'.format(definition.outputs),
+        'STATE_SIZE = {}'.format(len(slots)),
+        '',
+        ''
+    ]
+    if slots:
+        lines.append('def {}(state, {}):'.format(name, ', '.join(parameters)))
+        lines.append('    {}, = state'.format(', '.join(
+            state_names[slot] for slot in slots)))
+    else:
+        lines.append('def {}({}):'.format(name, ', '.join(parameters)))
+    lines.extend(writer.lines)
+    result = '({},)'.format(', '.join(output_expressions))
+    if slots:
+        result += ', [{}]'.format(', '.join(next_expressions))
+    lines.append('    return ' + result)
+    lines.extend(['', '', 'evaluate = {}'.format(name)])
+    return '\n'.join(lines) + '\n'
+
+
+def _cache_key(hdl_filename):
+    name = os.path.splitext(os.path.basename(hdl_filename))[0]
+    digest = hashlib.sha256(CODEGEN_VERSION + '\0')
+    for source in sorted(library_for(hdl_filename).sources(name),
+                         key=os.path.basename):
+        digest.update(os.path.basename(source) + '\0')
+        digest.update(open(source, 'rb').read() + '\0')
+    return name, digest.hexdigest()
+
+
+def load_compiled(hdl_filename, cache_dir=None):
+    """
+    Imports the generated module of the chip, generating it into the cache
+    unless an unchanged copy is already there
+    """
+    directory = cache_dir or DEFAULT_CACHE_DIR
+    name, key = _cache_key(hdl_filename)
+    module_filename = os.path.join(directory, '{}_{}.py'.format(
+        name, key[:32]))
+    if not os.path.exists(module_filename):
+        source = generate(hdl_filename)
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+        # Written to a temporary file first and renamed into place, so
+        # concurrent runs never see a half-written module
+        descriptor, temporary = tempfile.mkstemp(dir=directory)
+        module_file = os.fdopen(descriptor, 'w')
+        module_file.write(source)
+        module_file.close()
+        os.rename(temporary, module_filename)
+    return imp.load_source('compiled_{}_{}'.format(name, key[:32]),
+                           module_filename)
+
+
+class CompiledSimulator(object):
+    """
+    Runs a generated module with the `set`, `get`, `eval`, `tick` and `tock`
+    of the netlist simulator
+    """
+
+    def __init__(self, module):
+        self.module = module
+        self.function = module.evaluate
+        self.inputs = [pin for pin, _ in module.INPUTS]
+        self.values = dict((pin, 0) for pin in self.inputs)
+        self.state = [0] * module.STATE_SIZE
+        self.next_state = None
+        self.latched = None
+        self.cycles = 0
+        self.ticked = False
+        self.eval()
+
+    def eval(self):
+        arguments = [self.values[pin] for pin in self.inputs]
+        if self.module.STATE_SIZE:
+            outputs, self.next_state = self.function(self.state, *arguments)
+        else:
+            outputs = self.function(*arguments)
+        for (pin, _), value in zip(self.module.OUTPUTS, outputs):
+            self.values[pin] = value
+
+    def tick(self):
+        self.eval()
+        self.latched = self.next_state
+        self.ticked = True
+
+    def tock(self):
+        if not self.ticked:
+            self.tick()
+        if self.latched is not None:
+            self.state = self.latched
+        self.ticked = False
+        self.cycles += 1
+        self.eval()
+
+    def clock(self, cycles=1):
+        for _ in range(cycles):
+            self.tick()
+            self.tock()
+
+    @property
+    def time(self):
+        return '{}{}'.format(self.cycles, '+' if self.ticked else '')
+
+    def get(self, name):
+        if name not in self.values:
+            raise HDLError('{} has no pin {}'.format(self.module.NAME, name))
+        return self.values[name]
+
+    def set(self, name, value):
+        if name not in self.inputs:
+            raise HDLError('{} has no input pin {}'.format(self.module.NAME,
+                                                          name))
+        self.values[name] = value
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().split(
+        '\n\n')[0])
+    arg_parser.add_argument('chip', help='.hdl file of the chip')
+    args = arg_parser.parse_args()
+    sys.stdout.write(generate(args.chip))
+
+
+if __name__ == '__main__':
+    main()
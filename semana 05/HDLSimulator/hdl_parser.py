@@ -0,0 +1,151 @@
+"""
+Parser for nand2tetris `.hdl` chip definitions.
+"""
+import re
+
+_COMMENTS = re.compile(r'//[^\n]*|/\*.*?\*/', re.DOTALL)
+_TOKENS = re.compile(r'[A-Za-z_]\w*|\d+|\.\.|[{}()\[\],;=:]|\S')
+
+CONSTANTS = ('true', 'false')
+
+
+class HDLError(Exception):
+    pass
+
+
+class ChipDefinition(object):
+    """
+    `inputs` and `outputs` are lists of (pin name, width). Each part is
+    (chip name, connections), and each connection is
+    (pin, pin bits, wire, wire bits), where bits are a (low, high) range or
+    None for the whole pin or wire. `builtin` names the Python model of a
+    chip declared with BUILTIN.
+    """
+
+    def __init__(self, name, filename=None):
+        self.name = name
+        self.filename = filename
+        self.inputs = []
+        self.outputs = []
+        self.parts = []
+        self.builtin = None
+
+    def pin_width(self, pin):
+        for name, width in self.inputs + self.outputs:
+            if name == pin:
+                return width
+        return None
+
+
+class _Tokens(object):
+
+    def __init__(self, text, filename):
+        self.tokens = _TOKENS.findall(_COMMENTS.sub('', text))
+        self.position = 0
+        self.filename = filename
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            raise HDLError('{}: unexpected end of file'.format(self.filename))
+        self.position += 1
+        return token
+
+    def expect(self, expected):
+        token = self.next()
+        if token != expected:
+            raise HDLError('{}: expected {} but found {}'.format(
+                self.filename, expected, token))
+
+    def accept(self, token):
+        if self.peek() == token:
+            self.position += 1
+            return True
+        return False
+
+    def number(self):
+        token = self.next()
+        if not token.isdigit():
+            raise HDLError('{}: expected a number but found {}'.format(
+                self.filename, token))
+        return int(token)
+
+
+def _pin_declarations(tokens):
+    pins = []
+    while True:
+        name = tokens.next()
+        width = 1
+        if tokens.accept('['):
+            width = tokens.number()
+            tokens.expect(']')
+        pins.append((name, width))
+        if tokens.accept(';'):
+            return pins
+        tokens.expect(',')
+
+
+def _bits(tokens):
+    """
+    Optional `[i]` or `[i..j]` after a pin or wire name
+    """
+    if not tokens.accept('['):
+        return None
+    low = high = tokens.number()
+    if tokens.accept('..'):
+        high = tokens.number()
+    tokens.expect(']')
+    return low, high
+
+
+def _part(tokens, name):
+    connections = []
+    tokens.expect('(')
+    while True:
+        pin = tokens.next()
+        pin_bits = _bits(tokens)
+        tokens.expect('=')
+        wire = tokens.next()
+        wire_bits = _bits(tokens)
+        connections.append((pin, pin_bits, wire, wire_bits))
+        if tokens.accept(')'):
+            break
+        tokens.expect(',')
+    tokens.expect(';')
+    return name, connections
+
+
+def parse_hdl(text, filename='<hdl>'):
+    tokens = _Tokens(text, filename)
+    tokens.expect('CHIP')
+    chip = ChipDefinition(tokens.next(), filename)
+    tokens.expect('{')
+
+    while not tokens.accept('}'):
+        keyword = tokens.next()
+        if keyword == 'IN':
+            chip.inputs = _pin_declarations(tokens)
+        elif keyword == 'OUT':
+            chip.outputs = _pin_declarations(tokens)
+        elif keyword == 'BUILTIN':
+            chip.builtin = tokens.next()
+            tokens.expect(';')
+        elif keyword == 'CLOCKED':
+            # Builtin models know which of their inputs are clocked
+            while tokens.next() != ';':
+                pass
+        elif keyword == 'PARTS':
+            tokens.expect(':')
+        else:
+            chip.parts.append(_part(tokens, keyword))
+
+    return chip
+
+
+def parse_hdl_file(hdl_filename):
+    return parse_hdl(open(hdl_filename, 'rU').read(), hdl_filename)
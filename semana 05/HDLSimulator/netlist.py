@@ -0,0 +1,482 @@
+"""
+Builds chips into netlists of one-bit nets driven by Nand gates, DFFs and
+behavioural builtin chips.
+
+Every chip type is built once into a template over its own net ids. Small
+parts made only of primitives are copied into the template, bigger ones
+are kept as references and only expanded when the top chip is flattened,
+so a chip used thousands of times inside RAM16K is parsed and wired once.
+"""
+import os
+from array import array
+
+from builtin_chips import (BUILTIN_CHIPS, DFF, DFF_PINS, FAST_MODELS, NAND,
+                           NAND_PINS)
+from hdl_parser import CONSTANTS, HDLError, parse_hdl_file
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(os.path.dirname(HERE))
+
+CHIP_DIRECTORIES = [os.path.join(REPO_ROOT, directory) for directory in (
+    'semana 01', 'semana 2', os.path.join('semana 03', 'a'),
+    os.path.join('semana 03', 'b'), 'semana 05')]
+
+FALSE = 0
+TRUE = 1
+
+# Parts made only of primitives, and no more of them than this, are copied
+# into the chip that uses them
+INLINE_LIMIT = 512
+
+
+class ChipTemplate(object):
+    """
+    Netlist of one chip type over its own net ids, where 0 and 1 are the
+    constants false and true. `pins` maps every pin to the nets of its
+    bits, least significant first. Nand gates are kept as three parallel
+    lists of nets, DFFs as two, builtins as (model class, nets of each
+    input, nets of each output) and parts as (template, nets of each pin).
+    """
+
+    def __init__(self, name, inputs, outputs):
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.pins = {}
+        self.size = 2
+        self.nand_a = []
+        self.nand_b = []
+        self.nand_out = []
+        self.dff_in = []
+        self.dff_out = []
+        self.builtins = []
+        self.parts = []
+
+    def pin_width(self, pin):
+        for name, width in self.inputs + self.outputs:
+            if name == pin:
+                return width
+        return None
+
+    def is_input(self, pin):
+        return any(name == pin for name, _ in self.inputs)
+
+    @property
+    def primitives(self):
+        return len(self.nand_out) + len(self.dff_out) + len(self.builtins)
+
+    def new_net(self):
+        self.size += 1
+        return self.size - 1
+
+    def add_pins(self):
+        for name, width in self.inputs + self.outputs:
+            self.pins[name] = [self.new_net() for _ in range(width)]
+
+
+def _primitive_template(name, pins):
+    template = ChipTemplate(name, *pins)
+    template.add_pins()
+    if name == NAND:
+        template.nand_a.append(template.pins['a'][0])
+        template.nand_b.append(template.pins['b'][0])
+        template.nand_out.append(template.pins['out'][0])
+    else:
+        template.dff_in.append(template.pins['in'][0])
+        template.dff_out.append(template.pins['out'][0])
+    return template
+
+
+def _builtin_template(name, model):
+    template = ChipTemplate(name, model.inputs, model.outputs)
+    template.add_pins()
+    template.builtins.append((
+        model,
+        [template.pins[pin] for pin, _ in model.inputs],
+        [template.pins[pin] for pin, _ in model.outputs]))
+    return template
+
+
+class _Nets(object):
+    """
+    Union-find over the nets of a template being built. The lowest id of a
+    group wins, so constants beat pins and pins beat internal wires.
+    """
+
+    def __init__(self):
+        self.parent = [FALSE, TRUE]
+
+    def add(self, net):
+        while len(self.parent) <= net:
+            self.parent.append(len(self.parent))
+
+    def find(self, net):
+        root = net
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[net] != root:
+            self.parent[net], net = root, self.parent[net]
+        return root
+
+    def union(self, first, second):
+        first, second = self.find(first), self.find(second)
+        if first == second:
+            return
+        if (first, second) in ((FALSE, TRUE), (TRUE, FALSE)):
+            raise HDLError('A wire is connected to both true and false')
+        if second < first:
+            first, second = second, first
+        self.parent[second] = first
+
+
+class _ChipBuilder(object):
+    """
+    Wires the parts of one chip definition into a template
+    """
+
+    def __init__(self, library, definition):
+        self.library = library
+        self.definition = definition
+        self.template = ChipTemplate(definition.name, definition.inputs,
+                                     definition.outputs)
+        self.template.add_pins()
+        self.wires = dict(self.template.pins)
+        self.nets = _Nets()
+        self.nets.add(self.template.size)
+        # (part number, net inside the part, net in this chip) of every
+        # part output, to find nets with more than one driver
+        self.drivers = []
+
+    def error(self, message):
+        return HDLError('{}: {}'.format(self.definition.name, message))
+
+    def new_net(self):
+        net = self.template.new_net()
+        self.nets.add(net)
+        return net
+
+    def _wire_nets(self, wire, bits, width):
+        if wire in CONSTANTS:
+            return [TRUE if wire == 'true' else FALSE] * width
+        if wire not in self.wires:
+            if bits:
+                raise self.error('sub bus of unknown wire {}'.format(wire))
+            self.wires[wire] = [self.new_net() for _ in range(width)]
+        nets = self.wires[wire]
+        if bits:
+            low, high = bits
+            if high >= len(nets) or low > high:
+                raise self.error('{}[{}..{}] is out of range'.format(
+                    wire, low, high))
+            nets = nets[low:high + 1]
+        if len(nets) != width:
+            raise self.error('{} has {} bits, connected to {}'.format(
+                wire, len(nets), width))
+        return nets
+
+    def _part_nets(self, part, connections):
+        """
+        Returns the nets of this chip connected to every pin of the part
+        """
+        part_nets = {}
+        for pin, width in part.inputs:
+            part_nets[pin] = [FALSE] * width
+        for pin, width in part.outputs:
+            part_nets[pin] = [None] * width
+
+        for pin, pin_bits, wire, wire_bits in connections:
+            width = part.pin_width(pin)
+            if width is None:
+                raise self.error('{} has no pin {}'.format(part.name, pin))
+            low, high = pin_bits or (0, width - 1)
+            if high >= width or low > high:
+                raise self.error('{}.{}[{}..{}] is out of range'.format(
+                    part.name, pin, low, high))
+            nets = self._wire_nets(wire, wire_bits, high - low + 1)
+            if part.is_input(pin):
+                part_nets[pin][low:high + 1] = nets
+                continue
+            if wire in CONSTANTS:
+                raise self.error('output {}.{} is connected to {}'.format(
+                    part.name, pin, wire))
+            for bit, net in zip(range(low, high + 1), nets):
+                if part_nets[pin][bit] is None:
+                    part_nets[pin][bit] = net
+                else:
+                    self.nets.union(part_nets[pin][bit], net)
+
+        for pin, width in part.outputs:
+            part_nets[pin] = [net if net is not None else self.new_net()
+                              for net in part_nets[pin]]
+        return part_nets
+
+    def _connect(self, part_number, part, part_nets):
+        """
+        Joins the nets the part joins inside itself, and records its
+        drivers. Returns the net of this chip for each net of the part.
+        """
+        inside = [None] * part.size
+        inside[FALSE], inside[TRUE] = FALSE, TRUE
+        for pin, nets in part.pins.items():
+            for part_net, net in zip(nets, part_nets[pin]):
+                if inside[part_net] is None:
+                    inside[part_net] = net
+                else:
+                    self.nets.union(inside[part_net], net)
+        for pin, _ in part.outputs:
+            for part_net, net in zip(part.pins[pin], part_nets[pin]):
+                self.drivers.append((part_number, part_net, net))
+        return inside
+
+    def _inline(self, part, inside):
+        template = self.template
+        inside = [net if net is not None else self.new_net()
+                  for net in inside]
+        template.nand_a.extend(inside[net] for net in part.nand_a)
+        template.nand_b.extend(inside[net] for net in part.nand_b)
+        template.nand_out.extend(inside[net] for net in part.nand_out)
+        template.dff_in.extend(inside[net] for net in part.dff_in)
+        template.dff_out.extend(inside[net] for net in part.dff_out)
+        for model, inputs, outputs in part.builtins:
+            template.builtins.append((
+                model,
+                [[inside[net] for net in nets] for nets in inputs],
+                [[inside[net] for net in nets] for nets in outputs]))
+
+    def build(self):
+        for part_number, (name, connections) in enumerate(
+                self.definition.parts):
+            part = self.library.template(name)
+            part_nets = self._part_nets(part, connections)
+            inside = self._connect(part_number, part, part_nets)
+            if not part.parts and part.primitives <= INLINE_LIMIT:
+                self._inline(part, inside)
+            else:
+                self.template.parts.append((part, part_nets))
+
+        self._check_drivers()
+        self._compact()
+        return self.template
+
+    def _check_drivers(self):
+        inputs = set(self.nets.find(net) for pin, _ in self.template.inputs
+                     for net in self.template.pins[pin])
+        driven = {}
+        for part_number, part_net, net in self.drivers:
+            root = self.nets.find(net)
+            if root in (FALSE, TRUE) or root in inputs:
+                raise self.error('a part output drives a constant or an '
+                                 'input pin')
+            driver = part_number, part_net
+            if driven.setdefault(root, driver) != driver:
+                raise self.error('a wire has more than one driver')
+
+    def _compact(self):
+        """
+        Renumbers the nets so every group of joined nets is a single one
+        """
+        template = self.template
+        find = self.nets.find
+        numbers = {FALSE: FALSE, TRUE: TRUE}
+        renumber = [None] * template.size
+        for net in range(template.size):
+            root = find(net)
+            if root not in numbers:
+                numbers[root] = len(numbers)
+            renumber[net] = numbers[root]
+
+        template.size = len(numbers)
+        for pin in template.pins:
+            template.pins[pin] = [renumber[net] for net in template.pins[pin]]
+        for nets in ('nand_a', 'nand_b', 'nand_out', 'dff_in', 'dff_out'):
+            setattr(template, nets,
+                    [renumber[net] for net in getattr(template, nets)])
+        template.builtins = [
+            (model, [[renumber[net] for net in nets] for nets in inputs],
+             [[renumber[net] for net in nets] for nets in outputs])
+            for model, inputs, outputs in template.builtins]
+        template.parts = [
+            (part, dict((pin, [renumber[net] for net in nets])
+                        for pin, nets in part_nets.items()))
+            for part, part_nets in template.parts]
+
+
+class ChipLibrary(object):
+    """
+    Finds, parses and builds chips by name, each one once. Chips are looked
+    up in `directories` in order, then among the builtin models. Chips named
+    in `fast_models` are built as their behavioural model instead of their
+    HDL.
+    """
+
+    def __init__(self, directories=None, fast_models=()):
+        self.directories = list(directories or CHIP_DIRECTORIES)
+        self.fast_models = set(fast_models)
+        self.templates = {
+            NAND: _primitive_template(NAND, NAND_PINS),
+            DFF: _primitive_template(DFF, DFF_PINS)
+        }
+        self.definitions = {}
+        self._building = set()
+
+    def find(self, name):
+        for directory in self.directories:
+            hdl_filename = os.path.join(directory, name + '.hdl')
+            if os.path.isfile(hdl_filename):
+                return hdl_filename
+        return None
+
+    def definition(self, name):
+        """
+        The parsed HDL of a chip, or None for the chips built from a Python
+        model
+        """
+        if name not in self.definitions:
+            hdl_filename = None
+            if name not in self.fast_models:
+                hdl_filename = self.find(name)
+            self.definitions[name] = None
+            if hdl_filename is not None:
+                self.definitions[name] = parse_hdl_file(hdl_filename)
+        return self.definitions[name]
+
+    def sources(self, name):
+        """
+        The HDL files `name` is built from, itself included
+        """
+        filenames = []
+        seen = set()
+        pending = [name]
+        while pending:
+            definition = self.definition(pending.pop())
+            if definition is None or definition.filename in seen:
+                continue
+            seen.add(definition.filename)
+            filenames.append(definition.filename)
+            pending.extend(part for part, _ in definition.parts)
+        return filenames
+
+    def template(self, name):
+        if name not in self.templates:
+            if name in self._building:
+                raise HDLError('{} is built from itself'.format(name))
+            self._building.add(name)
+            self.templates[name] = self._load(name)
+            self._building.remove(name)
+        return self.templates[name]
+
+    def _load(self, name):
+        definition = self.definition(name)
+        if definition is None:
+            if name in self.fast_models:
+                return _builtin_template(name, FAST_MODELS[name])
+            if name in BUILTIN_CHIPS:
+                return _builtin_template(name, BUILTIN_CHIPS[name])
+            raise HDLError('Chip {} not found'.format(name))
+
+        if definition.builtin:
+            if definition.builtin not in BUILTIN_CHIPS:
+                raise HDLError('No builtin model for {}'.format(
+                    definition.builtin))
+            return _builtin_template(name, BUILTIN_CHIPS[definition.builtin])
+        return _ChipBuilder(self, definition).build()
+
+
+def library_for(hdl_filename, fast_models=()):
+    """
+    Library that looks in the chip's own directory before the chip
+    directories of the repository
+    """
+    directory = os.path.dirname(os.path.abspath(hdl_filename))
+    return ChipLibrary([directory] + CHIP_DIRECTORIES, fast_models)
+
+
+class Netlist(object):
+    """
+    Flat netlist of a chip. Nets are numbered from 0 to `size`, with 0 and
+    1 the constants false and true, and `pins` maps the pins of the chip to
+    their nets. Gates are stored as parallel arrays of nets. `schedule` is
+    filled in by the simulator the first time it runs the netlist.
+    """
+
+    def __init__(self, name, inputs, outputs):
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.pins = {}
+        self.size = 2
+        self.nand_a = array('i')
+        self.nand_b = array('i')
+        self.nand_out = array('i')
+        self.dff_in = array('i')
+        self.dff_out = array('i')
+        self.builtins = []
+        self.schedule = None
+
+    def _instantiate(self, template, nets):
+        """
+        Adds the gates of `template`, where `nets` gives the net of this
+        netlist for each net of the template
+        """
+        self.nand_a.extend(array('i', [nets[net] for net in template.nand_a]))
+        self.nand_b.extend(array('i', [nets[net] for net in template.nand_b]))
+        self.nand_out.extend(
+            array('i', [nets[net] for net in template.nand_out]))
+        self.dff_in.extend(array('i', [nets[net] for net in template.dff_in]))
+        self.dff_out.extend(
+            array('i', [nets[net] for net in template.dff_out]))
+        for model, inputs, outputs in template.builtins:
+            self.builtins.append((
+                model,
+                [[nets[net] for net in bits] for bits in inputs],
+                [[nets[net] for net in bits] for bits in outputs]))
+
+        for part, part_nets in template.parts:
+            inside = [None] * part.size
+            for pin, bits in part.pins.items():
+                for part_net, net in zip(bits, part_nets[pin]):
+                    inside[part_net] = nets[net]
+            inside[FALSE], inside[TRUE] = FALSE, TRUE
+            for part_net in range(part.size):
+                if inside[part_net] is None:
+                    inside[part_net] = self.size
+                    self.size += 1
+            self._instantiate(part, inside)
+
+
+def flatten(template):
+    netlist = Netlist(template.name, template.inputs, template.outputs)
+    netlist.pins = dict(template.pins)
+    netlist.size = template.size
+    netlist._instantiate(template, range(template.size))
+    return netlist
+
+
+def model_netlist(name):
+    """
+    Netlist of the behavioural model of `name` alone
+    """
+    return flatten(_builtin_template(name, FAST_MODELS[name]))
+
+
+def load_netlist(hdl_filename, fast_models=False, cache=None):
+    """
+    Parses the chip in `hdl_filename` and the chips it is built from, and
+    returns its flat netlist. With `fast_models` the parts that have a
+    behavioural model use it, though the chip itself is always built from
+    its HDL. The netlist is taken from `cache` when none of its HDL files
+    changed.
+    """
+    name = os.path.splitext(os.path.basename(hdl_filename))[0]
+    substituted = sorted(set(FAST_MODELS) - set([name])) if fast_models \
+        else []
+    library = library_for(hdl_filename, substituted)
+    if cache is None:
+        return flatten(library.template(name))
+
+    key = cache.key(library.sources(name), substituted)
+    netlist = cache.fetch(key)
+    if netlist is None:
+        netlist = flatten(library.template(name))
+        cache.store(key, netlist)
+    return netlist
@@ -0,0 +1,105 @@
+"""
+Cache of flattened netlists.
+"""
+import cPickle
+import hashlib
+import os
+import tempfile
+from array import array
+
+from builtin_chips import BUILTIN_CHIPS, FAST_MODELS
+from netlist import Netlist
+from simulator import schedule
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'hdl-netlists')
+
+# Part of the cache key: bump it whenever a change alters the netlists built
+NETLIST_VERSION = '1'
+NETLIST_EXTENSION = '.netlist'
+
+_GATE_ARRAYS = ('nand_a', 'nand_b', 'nand_out', 'dff_in', 'dff_out')
+
+
+class NetlistCache(object):
+    """
+    Entries are keyed by the SHA-256 of every HDL file the chip is built
+    from and the behavioural models used in place of HDL. Each file holds a
+    pickled header followed by the raw gate arrays and the simulator's
+    schedule, so loading a netlist of millions of gates is a few reads and
+    the simulator does not levelize it again.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or DEFAULT_CACHE_DIR
+
+    def key(self, hdl_filenames, fast_models=()):
+        digest = hashlib.sha256(NETLIST_VERSION + '\0')
+        digest.update(','.join(sorted(fast_models)) + '\0')
+        for hdl_filename in sorted(hdl_filenames,
+                                   key=os.path.basename):
+            digest.update(os.path.basename(hdl_filename) + '\0')
+            digest.update(open(hdl_filename, 'rb').read() + '\0')
+        return digest.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.directory, key + NETLIST_EXTENSION)
+
+    def fetch(self, key):
+        """
+        The cached netlist of `key`, or None if it is not cached
+        """
+        entry = self._entry(key)
+        if not os.path.exists(entry):
+            return None
+
+        netlist_file = open(entry, 'rb')
+        header = cPickle.load(netlist_file)
+        netlist = Netlist(header['name'], header['inputs'],
+                          header['outputs'])
+        netlist.pins = header['pins']
+        netlist.size = header['size']
+        arrays = []
+        for length in header['lengths']:
+            values = array('i')
+            values.fromfile(netlist_file, length)
+            arrays.append(values)
+        netlist_file.close()
+        for name, values in zip(_GATE_ARRAYS, arrays):
+            setattr(netlist, name, values)
+        netlist.schedule = tuple(arrays[len(_GATE_ARRAYS):])
+        models = dict(BUILTIN_CHIPS, **FAST_MODELS)
+        netlist.builtins = [(models[model], inputs, outputs)
+                            for model, inputs, outputs in header['builtins']]
+        return netlist
+
+    def store(self, key, netlist):
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            if not os.path.isdir(self.directory):
+                raise
+
+        if netlist.schedule is None:
+            netlist.schedule = schedule(netlist)
+        arrays = [getattr(netlist, name) for name in _GATE_ARRAYS]
+        arrays.extend(netlist.schedule)
+        header = {
+            'name': netlist.name,
+            'inputs': netlist.inputs,
+            'outputs': netlist.outputs,
+            'pins': netlist.pins,
+            'size': netlist.size,
+            'lengths': [len(values) for values in arrays],
+            'builtins': [(model.__name__, inputs, outputs)
+                         for model, inputs, outputs in netlist.builtins]
+        }
+        # Written to a temporary file first and renamed into place, so
+        # concurrent runs never see a half-written entry
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory)
+        netlist_file = os.fdopen(descriptor, 'wb')
+        cPickle.dump(header, netlist_file, cPickle.HIGHEST_PROTOCOL)
+        for values in arrays:
+            values.tofile(netlist_file)
+        netlist_file.close()
+        os.rename(temporary, self._entry(key))
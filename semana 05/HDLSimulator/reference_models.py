@@ -0,0 +1,71 @@
+"""
+Python models of the combinational chips, used by `verify` as the expected
+behaviour of their HDL. Every model takes the input pins as ints keyword
+arguments and returns a dict with the output pins.
+"""
+MASK16 = 0xFFFF
+
+
+def _mux_way(sel, *inputs):
+    return {'out': inputs[sel]}
+
+
+def _dmux_way(outputs, value, sel):
+    return dict((name, value if index == sel else 0)
+                for index, name in enumerate(outputs))
+
+
+def _add16(a, b):
+    return (a + b) & MASK16
+
+
+def alu(x, y, zx, nx, zy, ny, f, no):
+    if zx:
+        x = 0
+    if nx:
+        x ^= MASK16
+    if zy:
+        y = 0
+    if ny:
+        y ^= MASK16
+    out = _add16(x, y) if f else x & y
+    if no:
+        out ^= MASK16
+    return {'out': out, 'zr': int(out == 0), 'ng': out >> 15}
+
+
+def half_adder(a, b):
+    return {'sum': a ^ b, 'carry': a & b}
+
+
+def full_adder(a, b, c):
+    total = a + b + c
+    return {'sum': total & 1, 'carry': total >> 1}
+
+
+REFERENCE_MODELS = {
+    'Not': lambda **pins: {'out': pins['in'] ^ 1},
+    'And': lambda a, b: {'out': a & b},
+    'Or': lambda a, b: {'out': a | b},
+    'Xor': lambda a, b: {'out': a ^ b},
+    'Mux': lambda a, b, sel: {'out': b if sel else a},
+    'DMux': lambda sel, **pins: _dmux_way('ab', pins['in'], sel),
+    'Not16': lambda **pins: {'out': pins['in'] ^ MASK16},
+    'And16': lambda a, b: {'out': a & b},
+    'Or16': lambda a, b: {'out': a | b},
+    'Mux16': lambda a, b, sel: {'out': b if sel else a},
+    'Or8Way': lambda **pins: {'out': int(pins['in'] != 0)},
+    'Mux4Way': lambda a, b, c, d, sel: _mux_way(sel, a, b, c, d),
+    'Mux4Way16': lambda a, b, c, d, sel: _mux_way(sel, a, b, c, d),
+    'Mux8Way': lambda a, b, c, d, e, f, g, h, sel:
+        _mux_way(sel, a, b, c, d, e, f, g, h),
+    'Mux8Way16': lambda a, b, c, d, e, f, g, h, sel:
+        _mux_way(sel, a, b, c, d, e, f, g, h),
+    'DMux4Way': lambda sel, **pins: _dmux_way('abcd', pins['in'], sel),
+    'DMux8Way': lambda sel, **pins: _dmux_way('abcdefgh', pins['in'], sel),
+    'HalfAdder': half_adder,
+    'FullAdder': full_adder,
+    'Add16': lambda a, b: {'out': _add16(a, b)},
+    'Inc16': lambda **pins: {'out': _add16(pins['in'], 1)},
+    'ALU': alu
+}
@@ -0,0 +1,322 @@
+"""
+Event-driven simulator for flat netlists.
+
+The combinational nodes, Nand gates and builtin chips, are sorted into
+levels once, so a node only reads nets settled by lower levels. Changing a
+net queues the nodes that read it, and evaluation walks the levels in
+order, so each node is evaluated at most once per change and only when one
+of its inputs changed. DFFs are queued the same way when their input
+changes, and the clock only visits those.
+"""
+from array import array
+from itertools import izip
+
+from hdl_parser import HDLError
+
+
+def _csr(count, readers):
+    """
+    Groups the (nets, nodes) array pairs of `readers` by net into `starts`
+    and `nodes` arrays, where the nodes reading net n are
+    nodes[starts[n]:starts[n + 1]]
+    """
+    starts = array('i', [0]) * (count + 1)
+    for nets, _ in readers:
+        for net in nets:
+            starts[net + 1] += 1
+    for net in range(count):
+        starts[net + 1] += starts[net]
+    grouped = array('i', [0]) * starts[count]
+    filled = starts[:count]
+    for nets, nodes in readers:
+        for net, node in izip(nets, nodes):
+            grouped[filled[net]] = node
+            filled[net] += 1
+    return starts, grouped
+
+
+def _readers(netlist):
+    """
+    (nets, nodes) arrays pairing every node input with its node, clocked
+    builtin inputs excepted. Nodes are numbered: Nand gates, then builtins,
+    then DFFs
+    """
+    first_builtin = len(netlist.nand_out)
+    first_dff = first_builtin + len(netlist.builtins)
+    nands = array('i', range(first_builtin))
+    builtin_nets = array('i')
+    builtin_nodes = array('i')
+    for index, (model, inputs, _) in enumerate(netlist.builtins):
+        for (pin, _), bits in zip(model.inputs, inputs):
+            if pin not in model.clocked:
+                builtin_nets.extend(bits)
+                builtin_nodes.extend([first_builtin + index] * len(bits))
+    dffs = array('i', range(first_dff, first_dff + len(netlist.dff_in)))
+    return [(netlist.nand_a, nands), (netlist.nand_b, nands),
+            (builtin_nets, builtin_nodes), (netlist.dff_in, dffs)]
+
+
+def _levelize(netlist, fanout_starts, fanout):
+    """
+    Returns the level of every combinational node: one more than the
+    highest level among the nodes driving its inputs
+    """
+    first_builtin = len(netlist.nand_out)
+    first_dff = first_builtin + len(netlist.builtins)
+    builtin_outputs = [[net for bits in outputs for net in bits]
+                       for _, _, outputs in netlist.builtins]
+    driver = array('i', [-1]) * netlist.size
+    for node, net in enumerate(netlist.nand_out):
+        driver[net] = node
+    for index, outputs in enumerate(builtin_outputs):
+        for net in outputs:
+            driver[net] = first_builtin + index
+
+    # Inputs of each node still waiting for their driver to be leveled
+    pending = array('i', [0]) * first_dff
+    for node, net in enumerate(netlist.nand_a):
+        if driver[net] >= 0:
+            pending[node] += 1
+    for node, net in enumerate(netlist.nand_b):
+        if driver[net] >= 0:
+            pending[node] += 1
+    for index, (model, inputs, _) in enumerate(netlist.builtins):
+        for (pin, _), bits in zip(model.inputs, inputs):
+            if pin not in model.clocked:
+                pending[first_builtin + index] += sum(
+                    1 for net in bits if driver[net] >= 0)
+
+    level = array('i', [0]) * first_dff
+    ready = [node for node in range(first_dff) if not pending[node]]
+    nand_out = netlist.nand_out
+    pop, append = ready.pop, ready.append
+    done = 0
+    while ready:
+        node = pop()
+        done += 1
+        next_level = level[node] + 1
+        if node < first_builtin:
+            outputs = (nand_out[node],)
+        else:
+            outputs = builtin_outputs[node - first_builtin]
+        for net in outputs:
+            for reader in fanout[fanout_starts[net]:fanout_starts[net + 1]]:
+                if reader < first_dff:
+                    if level[reader] < next_level:
+                        level[reader] = next_level
+                    waiting = pending[reader] - 1
+                    pending[reader] = waiting
+                    if not waiting:
+                        append(reader)
+    if done != first_dff:
+        raise HDLError('{} has a combinational loop'.format(netlist.name))
+    return level
+
+
+def schedule(netlist):
+    """
+    The (fanout starts, fanout, level) arrays the simulator runs a netlist
+    with: the nodes reading each net, and the level of every combinational
+    node
+    """
+    fanout_starts, fanout = _csr(netlist.size, _readers(netlist))
+    return fanout_starts, fanout, _levelize(netlist, fanout_starts, fanout)
+
+
+class Simulator(object):
+    """
+    Simulates a netlist. Inputs are set with `set`, and `eval`, `tick` and
+    `tock` work like in the nand2tetris test scripts. `models` holds the
+    behavioural builtin chips, in netlist order. The schedule of the netlist
+    is computed once and kept in `netlist.schedule`.
+    """
+
+    def __init__(self, netlist):
+        self.netlist = netlist
+        self.nand_a = netlist.nand_a
+        self.nand_b = netlist.nand_b
+        self.nand_out = netlist.nand_out
+        self.dff_in = netlist.dff_in
+        self.dff_out = netlist.dff_out
+        self.models = [model() for model, _, _ in netlist.builtins]
+        self.builtin_inputs = [inputs for _, inputs, _ in netlist.builtins]
+        self.builtin_outputs = [outputs for _, _, outputs in netlist.builtins]
+        self.clocked_models = [index for index, model in
+                               enumerate(self.models) if model.clocked]
+
+        # Nodes are numbered: Nand gates, then builtins, then DFFs
+        self.first_builtin = len(self.nand_out)
+        self.first_dff = self.first_builtin + len(self.models)
+        nodes = self.first_dff + len(self.dff_out)
+        if netlist.schedule is None:
+            netlist.schedule = schedule(netlist)
+        self.fanout_starts, self.fanout, self.level = netlist.schedule
+
+        self.values = bytearray(netlist.size)
+        self.values[1] = 1
+        self.latched = None
+        self.cycles = 0
+        self.ticked = False
+
+        self.queued = bytearray(nodes)
+        self.buckets = [[] for _ in range(max(self.level or [0]) + 1)]
+        self._settle()
+        # Every DFF may differ from its input until the first tick
+        self.pending_dffs = list(range(self.first_dff, nodes))
+        for node in self.pending_dffs:
+            self.queued[node] = 1
+
+    def _queue(self, node):
+        if not self.queued[node]:
+            self.queued[node] = 1
+            if node >= self.first_dff:
+                self.pending_dffs.append(node)
+            else:
+                self.buckets[self.level[node]].append(node)
+
+    def _changed(self, net):
+        for position in range(self.fanout_starts[net],
+                              self.fanout_starts[net + 1]):
+            self._queue(self.fanout[position])
+
+    def _read(self, bits):
+        values = self.values
+        value = 0
+        for bit, net in enumerate(bits):
+            if values[net]:
+                value |= 1 << bit
+        return value
+
+    def _write(self, bits, value):
+        values = self.values
+        for bit, net in enumerate(bits):
+            new = value >> bit & 1
+            if values[net] != new:
+                values[net] = new
+                self._changed(net)
+
+    def _settle(self):
+        """
+        Evaluates every combinational node once, level by level
+        """
+        for node, level in enumerate(self.level):
+            self.buckets[level].append(node)
+        values = self.values
+        nand_a, nand_b, nand_out = self.nand_a, self.nand_b, self.nand_out
+        for bucket in self.buckets:
+            for node in bucket:
+                if node < self.first_builtin:
+                    values[nand_out[node]] = 0 if values[nand_a[node]] and \
+                        values[nand_b[node]] else 1
+                else:
+                    self._evaluate_builtin(node - self.first_builtin)
+            del bucket[:]
+        self.pending_dffs = []
+        self.queued[:] = bytearray(len(self.queued))
+
+    def eval(self):
+        """
+        Propagates every queued change through the combinational nodes
+        """
+        values = self.values
+        queued = self.queued
+        nand_a, nand_b, nand_out = self.nand_a, self.nand_b, self.nand_out
+        fanout_starts, fanout = self.fanout_starts, self.fanout
+        first_builtin = self.first_builtin
+        queue = self._queue
+
+        for bucket in self.buckets:
+            while bucket:
+                node = bucket.pop()
+                queued[node] = 0
+                if node < first_builtin:
+                    out = nand_out[node]
+                    value = 0 if values[nand_a[node]] and \
+                        values[nand_b[node]] else 1
+                    if values[out] != value:
+                        values[out] = value
+                        for position in range(fanout_starts[out],
+                                              fanout_starts[out + 1]):
+                            queue(fanout[position])
+                else:
+                    self._evaluate_builtin(node - first_builtin)
+
+    def reevaluate(self):
+        """
+        Queues every builtin chip, for when a model's contents were changed
+        from outside, like a program loaded into a ROM
+        """
+        for index in range(len(self.models)):
+            self._queue(self.first_builtin + index)
+        self.eval()
+
+    def _evaluate_builtin(self, index):
+        outputs = self.models[index].evaluate(
+            [self._read(bits) for bits in self.builtin_inputs[index]])
+        for bits, value in zip(self.builtin_outputs[index], outputs):
+            self._write(bits, value)
+
+    def tick(self):
+        """
+        Rising clock edge: settles the inputs and samples them into the DFFs
+        and clocked builtins
+        """
+        self.eval()
+        values = self.values
+        latched = []
+        for node in self.pending_dffs:
+            self.queued[node] = 0
+            index = node - self.first_dff
+            value = values[self.dff_in[index]]
+            if values[self.dff_out[index]] != value:
+                latched.append((self.dff_out[index], value))
+        self.pending_dffs = []
+        self.latched = latched
+        for index in self.clocked_models:
+            self.models[index].tick(
+                [self._read(bits) for bits in self.builtin_inputs[index]])
+        self.ticked = True
+
+    def tock(self):
+        """
+        Falling clock edge: the sampled values reach the outputs
+        """
+        if not self.ticked:
+            self.tick()
+        for net, value in self.latched:
+            self.values[net] = value
+            self._changed(net)
+        self.latched = None
+        for index in self.clocked_models:
+            self.models[index].tock()
+            self._queue(self.first_builtin + index)
+        self.ticked = False
+        self.cycles += 1
+        self.eval()
+
+    def clock(self, cycles=1):
+        for _ in range(cycles):
+            self.tick()
+            self.tock()
+
+    @property
+    def time(self):
+        return '{}{}'.format(self.cycles, '+' if self.ticked else '')
+
+    def pin(self, name):
+        if name not in self.netlist.pins:
+            raise HDLError('{} has no pin {}'.format(self.netlist.name, name))
+        return self.netlist.pins[name]
+
+    def get(self, name):
+        return self._read(self.pin(name))
+
+    def set(self, name, value):
+        self._write(self.pin(name), value)
+
+    def builtin(self, name):
+        """
+        The models of every builtin chip called `name`
+        """
+        return [model for model in self.models
+                if model.__class__.__name__ == name]
@@ -0,0 +1,240 @@
+"""
+Checks chips against their Python models: combinational chips against
+`reference_models`, for every input vector when there are few enough of
+them or for many random ones, and the RAM, Register and PC chips against
+their fast models.
+
+The netlist is evaluated bit-sliced: each net holds one Python int with the
+value of that net for thousands of vectors, one every `stride` bits, so a
+Nand gate is a single `~(a & b)` for the whole batch. Vectors are packed
+with all their input pins side by side in `stride` bits, so the input nets
+are shifts and masks of the packed batch, and the outputs of the whole
+batch come back packed the same way and are compared in one xor.
+
+Chips with a fast behavioural model are sequential, so they are instead
+run for random cycles next to their model, comparing the outputs after
+every clock edge.
+"""
+import argparse
+import random
+import sys
+import time
+
+from builtin_chips import FAST_MODELS
+from hdl_parser import HDLError
+from netlist import FALSE, TRUE, load_netlist, model_netlist
+from reference_models import REFERENCE_MODELS
+from simulator import Simulator
+
+LANES = 4096
+RANDOM_VECTORS = 100000
+RANDOM_CYCLES = 1000
+# Chips with at most this many input bits are checked exhaustively
+EXHAUSTIVE_LIMIT = 20
+
+
+def _fields(pins):
+    """
+    (name, shift, mask) of every pin when they are packed side by side,
+    the first pin in the low bits
+    """
+    fields = []
+    shift = 0
+    for name, width in pins:
+        fields.append((name, shift, (1 << width) - 1))
+        shift += width
+    return fields
+
+
+def _unpack(fields, word):
+    return dict((name, word >> shift & mask) for name, shift, mask in fields)
+
+
+def _pack(fields, values):
+    word = 0
+    for name, shift, _ in fields:
+        word |= values[name] << shift
+    return word
+
+
+class BitSlicedChip(object):
+    """
+    Evaluates the netlist of a combinational chip for a batch of packed
+    input vectors at once
+    """
+
+    def __init__(self, netlist):
+        if len(netlist.dff_out) or netlist.builtins:
+            raise HDLError('{} is not combinational'.format(netlist.name))
+        self.netlist = netlist
+        self.input_fields = _fields(netlist.inputs)
+        self.output_fields = _fields(netlist.outputs)
+        self.input_nets = [net for name, _ in netlist.inputs
+                           for net in netlist.pins[name]]
+        self.output_nets = [net for name, _ in netlist.outputs
+                            for net in netlist.pins[name]]
+        width = max(len(self.input_nets), len(self.output_nets))
+        self.stride = (width + 3) & ~3
+
+        level = Simulator(netlist).level
+        self.gates = [(netlist.nand_a[node], netlist.nand_b[node],
+                       netlist.nand_out[node]) for node in
+                      sorted(range(len(netlist.nand_out)),
+                             key=level.__getitem__)]
+
+    def pack(self, words):
+        """
+        One int with `words` every `stride` bits, words[0] in the low bits
+        """
+        digits = self.stride // 4
+        return int(''.join('{:0{}x}'.format(word, digits)
+                           for word in reversed(words)) or '0', 16)
+
+    def lane(self, packed, lane):
+        return packed >> lane * self.stride & ((1 << self.stride) - 1)
+
+    def evaluate(self, packed, lanes):
+        """
+        Returns the packed outputs of the `lanes` input vectors in `packed`
+        """
+        ones = int(('0' * (self.stride // 4 - 1) + '1') * lanes, 16)
+        values = [0] * self.netlist.size
+        values[FALSE], values[TRUE] = 0, ones
+        for bit, net in enumerate(self.input_nets):
+            values[net] = packed >> bit & ones
+        for a, b, out in self.gates:
+            values[out] = ~(values[a] & values[b]) & ones
+
+        outputs = 0
+        for bit, net in enumerate(self.output_nets):
+            outputs |= values[net] << bit
+        return outputs
+
+
+def _batches(width, vectors, lanes):
+    if vectors is None:
+        for start in range(0, 1 << width, lanes):
+            yield range(start, min(start + lanes, 1 << width))
+    else:
+        for start in range(0, vectors, lanes):
+            yield [random.getrandbits(width)
+                   for _ in range(min(lanes, vectors - start))]
+
+
+def verify(netlist, model, vectors=None, lanes=LANES):
+    """
+    Checks the chip against `model` for `vectors` random input vectors, or
+    all of them when `vectors` is None. Returns the number of vectors
+    checked and the first mismatch as (inputs, expected, outputs) dicts, or
+    None
+    """
+    chip = BitSlicedChip(netlist)
+    input_fields, output_fields = chip.input_fields, chip.output_fields
+    checked = 0
+    for batch in _batches(len(chip.input_nets), vectors, lanes):
+        expected = chip.pack([
+            _pack(output_fields, model(**_unpack(input_fields, word)))
+            for word in batch])
+        outputs = chip.evaluate(chip.pack(batch), len(batch))
+        wrong = outputs ^ expected
+        if wrong:
+            lane = ((wrong & -wrong).bit_length() - 1) // chip.stride
+            return checked + lane, (
+                _unpack(input_fields, batch[lane]),
+                _unpack(output_fields, chip.lane(expected, lane)),
+                _unpack(output_fields, chip.lane(outputs, lane)))
+        checked += len(batch)
+    return checked, None
+
+
+def verify_model(netlist, cycles=RANDOM_CYCLES):
+    """
+    Runs the chip and its fast model side by side with random inputs.
+    Returns the number of cycles run and the first mismatch as (inputs,
+    expected, outputs) dicts, or None
+    """
+    chip = Simulator(netlist)
+    model = Simulator(model_netlist(netlist.name))
+    names = [name for name, _ in netlist.outputs]
+    for cycle in range(cycles):
+        inputs = dict((name, random.getrandbits(width))
+                      for name, width in netlist.inputs)
+        for name, value in inputs.items():
+            chip.set(name, value)
+            model.set(name, value)
+        for step in ('eval', 'tick', 'tock'):
+            getattr(chip, step)()
+            getattr(model, step)()
+            outputs = dict((name, chip.get(name)) for name in names)
+            expected = dict((name, model.get(name)) for name in names)
+            if outputs != expected:
+                return cycle, (inputs, expected, outputs)
+    return cycles, None
+
+
+def _format_pins(fields, values):
+    return ', '.join('{}={}'.format(name, values[name])
+                     for name, _, _ in fields)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().split(
+        '\n\n')[0])
+    arg_parser.add_argument('chips', nargs='+', metavar='chip',
+                            help='.hdl file of a chip')
+    arg_parser.add_argument('--random', type=int, default=RANDOM_VECTORS,
+                            help='random vectors to check chips with too '
+                                 'many inputs to check them all '
+                                 '(default: %(default)s)')
+    arg_parser.add_argument('--exhaustive-limit', type=int,
+                            default=EXHAUSTIVE_LIMIT,
+                            help='check every vector of chips with at most '
+                                 'this many input bits (default: '
+                                 '%(default)s)')
+    arg_parser.add_argument('--cycles', type=int, default=RANDOM_CYCLES,
+                            help='random cycles to run chips with a fast '
+                                 'model for (default: %(default)s)')
+    arg_parser.add_argument('--lanes', type=int, default=LANES,
+                            help='vectors evaluated at once (default: '
+                                 '%(default)s)')
+    arg_parser.add_argument('--seed', type=int,
+                            help='seed of the random vectors')
+    args = arg_parser.parse_args()
+    random.seed(args.seed)
+
+    failed = 0
+    for hdl_filename in args.chips:
+        netlist = load_netlist(hdl_filename)
+        start = time.time()
+        if netlist.name in FAST_MODELS:
+            checked, mismatch = verify_model(netlist, args.cycles)
+            kind = 'random cycles,'
+        elif netlist.name in REFERENCE_MODELS:
+            width = sum(width for _, width in netlist.inputs)
+            vectors = args.random if width > args.exhaustive_limit else None
+            checked, mismatch = verify(
+                netlist, REFERENCE_MODELS[netlist.name], vectors, args.lanes)
+            kind = 'random' if vectors is not None else 'exhaustive'
+            kind += ' vectors'
+        else:
+            print 'SKIP {:<10} no reference model'.format(netlist.name)
+            continue
+        elapsed = time.time() - start
+        if mismatch is None:
+            print 'PASS {:<10} {:>9} {} in {:.2f} s'.format(
+                netlist.name, checked, kind, elapsed)
+            continue
+        failed += 1
+        inputs, expected, outputs = mismatch
+        fields = _fields(netlist.outputs)
+        print 'FAIL {:<10} after {} {}'.format(
+            netlist.name, checked, kind)
+        print '    inputs:   {}'.format(_format_pins(_fields(netlist.inputs),
+                                                     inputs))
+        print '    expected: {}'.format(_format_pins(fields, expected))
+        print '    got:      {}'.format(_format_pins(fields, outputs))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
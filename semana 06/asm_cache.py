@@ -0,0 +1,71 @@
+"""
+Content-addressed cache of assembled ROMs.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+
+from hackbin import HACKBIN_EXTENSION, write_hackbin
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'hack-assembler')
+
+
+class AssemblyCache(object):
+    """
+    Entries are keyed by the SHA-256 of the `.asm` source and the assembler
+    version, and keep the ROM both as text `.hack` and as packed `.hackbin`.
+    The `.hackbin` file is written last, so it marks a complete entry.
+    """
+
+    def __init__(self, version, write_hack, directory=None):
+        self.version = version
+        self.write_hack = write_hack
+        self.directory = directory or DEFAULT_CACHE_DIR
+
+    def key(self, asm_filename):
+        digest = hashlib.sha256(self.version + '\0')
+        asm_file = open(asm_filename, 'rb')
+        for chunk in iter(lambda: asm_file.read(1 << 16), b''):
+            digest.update(chunk)
+        asm_file.close()
+        return digest.hexdigest()
+
+    def _entry(self, key, extension):
+        return os.path.join(self.directory, key + extension)
+
+    def fetch(self, key, filename, write_bin=False):
+        """
+        Copies the cached outputs of `key` to `filename` plus the extension
+        of each format. Returns the number of words in the ROM, or None if
+        the entry is not cached
+        """
+        packed_entry = self._entry(key, HACKBIN_EXTENSION)
+        if not os.path.exists(packed_entry):
+            return None
+
+        shutil.copyfile(self._entry(key, '.hack'), filename + '.hack')
+        if write_bin:
+            shutil.copyfile(packed_entry, filename + HACKBIN_EXTENSION)
+        return os.path.getsize(packed_entry) // 2
+
+    def store(self, key, rom):
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            if not os.path.isdir(self.directory):
+                raise
+
+        self._write(self.write_hack, rom, self._entry(key, '.hack'))
+        self._write(write_hackbin, rom, self._entry(key, HACKBIN_EXTENSION))
+
+    def _write(self, writer, rom, entry):
+        """
+        Writes to a temporary file first and renames it into place, so
+        concurrent builds never see a half-written entry
+        """
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory)
+        os.close(descriptor)
+        writer(rom, temporary)
+        os.rename(temporary, entry)
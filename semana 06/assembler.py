@@ -1,9 +1,22 @@
+import argparse
+import os
 import sys
+import time
+from array import array
+from multiprocessing import Pool, cpu_count
 
-if __name__ != '__main__':
-    print 'Please run as a self-conatined program'
+from asm_cache import AssemblyCache
+from hackbin import HACKBIN_EXTENSION, write_hackbin
+from peephole import NumericJumpTarget, PeepholeOptimizer
 
-symbols = {
+# The VM translator owns the source map format
+VM_TRANSLATOR_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'semana 08', 'VMTranslator')
+
+# Part of the cache key: bump it whenever a change alters the encoded output
+ASSEMBLER_VERSION = '3'
+
+PREDEFINED_SYMBOLS = {
     'R0': 0,
     'R1': 1,
     'R2': 2,
@@ -28,112 +41,105 @@ symbols = {
     'THIS': 3,
     'THAT': 4
 }
-next_address = 16
-
-
-def remove_comments_and_whitespace(line):
-    without_comments = line.split('/')[0]
-    return without_comments.replace(' ', '')
-
+FIRST_VARIABLE_ADDRESS = 16
+
+COMP_CODES = {
+    '0': 0b0101010,
+    '1': 0b0111111,
+    '-1': 0b0111010,
+    'D': 0b0001100,
+    'A': 0b0110000,
+    '!D': 0b0001101,
+    '!A': 0b0110001,
+    '-D': 0b0001111,
+    '-A': 0b0110011,
+    'D+1': 0b0011111,
+    'A+1': 0b0110111,
+    'D-1': 0b0001110,
+    'A-1': 0b0110010,
+    'D+A': 0b0000010,
+    'D-A': 0b0010011,
+    'A-D': 0b0000111,
+    'D&A': 0b0000000,
+    'D|A': 0b0010101,
+    'M': 0b1110000,
+    '!M': 0b1110001,
+    '-M': 0b1110011,
+    'M+1': 0b1110111,
+    'M-1': 0b1110010,
+    'D+M': 0b1000010,
+    'D-M': 0b1010011,
+    'M-D': 0b1000111,
+    'D&M': 0b1000000,
+    'D|M': 0b1010101,
+    # Commutative spellings, as emitted by the VM translator
+    'A+D': 0b0000010,
+    'A&D': 0b0000000,
+    'A|D': 0b0010101,
+    'M+D': 0b1000010,
+    'M&D': 0b1000000,
+    'M|D': 0b1010101
+}
 
-def get_instructions(hack_filename):
-    hack_text = open(hack_filename, 'r')
+JUMP_CODES = {
+    None: 0b000,
+    'JGT': 0b001,
+    'JEQ': 0b010,
+    'JGE': 0b011,
+    'JLT': 0b100,
+    'JNE': 0b101,
+    'JLE': 0b110,
+    'JMP': 0b111
+}
 
-    instructions = []
-    for line in hack_text.read().split('\r\n'):
-        stripped = remove_comments_and_whitespace(line)
-        if stripped:
-            instructions.append(stripped)
+# Encoded word for every C-instruction spelling seen so far, shared by all
+# the files assembled by this process
+c_instructions = {}
 
-    return instructions
 
+def remove_comments_and_whitespace(line):
+    without_comments = line.split('/')[0]
+    return ''.join(without_comments.split())
 
-def parse_symbol(symbol):
-    global next_address
-    if symbol not in symbols:
-        symbols[symbol] = next_address
-        next_address += 1
 
-    return symbols[symbol]
+def read_lines(asm_filename):
+    """
+    Generator that yields the lines of a `.asm` file one at a time.
+    Lines are read through a buffered universal-newline file, so `\r\n`,
+    `\n` and `\r` endings are all handled without loading the whole file.
+    """
+    asm_file = open(asm_filename, 'rU')
 
+    for line in asm_file:
+        yield line
 
-def int_to_bin(num, bit_size=16):
-    bin_num = bin(num)[2:]
-    return (bit_size - len(bin_num)) * '0' + bin_num
+    asm_file.close()
 
 
-def parse_a_instruction(instruction):
-    address = instruction[1:]
-    try:
-        return int_to_bin(int(address))
-    except ValueError:
-        return int_to_bin(parse_symbol(address))
-
-
-def get_bin_comp(comp):
-    return {
-        '0': '0101010',
-        '1': '0111111',
-        '-1': '0111010',
-        'D': '0001100',
-        'A': '0110000',
-        '!D': '0001101',
-        '!A': '0110001',
-        '-D': '0001111',
-        '-A': '0110011',
-        'D+1': '0011111',
-        'A+1': '0110111',
-        'D-1': '0001110',
-        'A-1': '0110010',
-        'D+A': '0000010',
-        'D-A': '0010011',
-        'A-D': '0000111',
-        'D&A': '0000000',
-        'D|A': '0010101',
-        'M': '1110000',
-        '!M': '1110001',
-        '-M': '1110011',
-        'M+1': '1110111',
-        'M-1': '1110010',
-        'D+M': '1000010',
-        'D-M': '1010011',
-        'M-D': '1000111',
-        'D&M': '1000000',
-        'D|M': '1010101'
-    }[comp]
+def get_instructions(lines):
+    for line in lines:
+        stripped = remove_comments_and_whitespace(line)
+        if stripped:
+            yield stripped
 
 
 def get_bin_dest(dest):
-    dest_list = ['0', '0', '0']
+    bin_dest = 0b000
     if not dest:
-        return ''.join(dest_list)
+        return bin_dest
     if 'A' in dest:
-        dest_list[0] = '1'
+        bin_dest |= 0b100
     if 'D' in dest:
-        dest_list[1] = '1'
+        bin_dest |= 0b010
     if 'M' in dest:
-        dest_list[2] = '1'
-    return ''.join(dest_list)
-
-
-def get_bin_jmp(jmp):
-    if not jmp:
-        return '000'
-    return {
-        'JGT': '001',
-        'JEQ': '010',
-        'JGE': '011',
-        'JLT': '100',
-        'JNE': '101',
-        'JLE': '110',
-        'JMP': '111'
-    }[jmp]
+        bin_dest |= 0b001
+    return bin_dest
 
 
 def parse_c_instruction(instruction):
-    bin_output = '111'
     dest = None
     jmp = None
+    spelling = instruction
 
     if '=' in instruction:
         [dest, instruction] = instruction.split('=')
@@ -142,38 +148,313 @@ def parse_c_instruction(instruction):
     else:
         comp = instruction
 
-    bin_output += get_bin_comp(comp)
-    bin_output += get_bin_dest(dest)
-    bin_output += get_bin_jmp(jmp)
-    return bin_output
-
-try:
-    hack_filename = sys.argv[1]
-except IndexError:
-    sys.exit('Please add a .asm file as an argument of the assembler')
-
-instructions = get_instructions(hack_filename)
-
-counter = 0
-for idx, val in enumerate(instructions):
-    if val[0] == '(' and val[len(val) - 1] == ')':
-        loop = val.replace('(', '').replace(')', '')
-        symbols[loop] = idx - counter
-        counter += 1
-
-filename = hack_filename.split('.asm')[0]
-
-output_file = filename + '.hack'
-output = open(output_file, 'w')
-
-for instruction in instructions:
-    if instruction[0] == '(':
-        continue
-
-    elif instruction[0] == '@':
-        binary_instruction = parse_a_instruction(instruction)
-
-    else:
-        binary_instruction = parse_c_instruction(instruction)
-
-    output.write(binary_instruction + '\r\n')
+    word = (0b111 << 13 |
+            COMP_CODES[comp] << 6 |
+            get_bin_dest(dest) << 3 |
+            JUMP_CODES[jmp])
+    c_instructions[spelling] = word
+    return word
+
+
+class Assembler(object):
+    """
+    Owns the symbol table and the RAM allocator for variables, so a single
+    process can assemble any number of programs one after the other.
+    The table of the last assembled program is kept in `symbols`, and with
+    `peephole` set the optimizer that ran on it in `optimizer`.
+    """
+
+    def __init__(self, peephole=False):
+        self.peephole = peephole
+        self.optimizer = None
+        self._reset()
+
+    def _reset(self):
+        self.symbols = dict(PREDEFINED_SYMBOLS)
+        self.next_address = FIRST_VARIABLE_ADDRESS
+
+    def parse_symbol(self, symbol):
+        if symbol not in self.symbols:
+            self.symbols[symbol] = self.next_address
+            self.next_address += 1
+
+        return self.symbols[symbol]
+
+    def assemble(self, lines):
+        """
+        Encodes the source lines to 16-bit words in a single pass.
+        References to symbols are recorded in a fixup table and patched
+        once every label has been seen; the ones that are not labels are
+        variables, allocated in order of first use.
+        """
+        self._reset()
+        instructions = get_instructions(lines)
+        if self.peephole:
+            self.optimizer = PeepholeOptimizer()
+            instructions = self.optimizer.optimize(instructions)
+        rom, fixups = self.encode(instructions)
+        self.resolve(rom, fixups)
+        return rom
+
+    def encode(self, instructions):
+        """
+        Returns the ROM with a placeholder for every symbol other than the
+        predefined ones, and the (ROM address, symbol) fixups to patch them.
+        Even labels seen already are patched later, since a label defined
+        again takes the address of its last definition everywhere, like in
+        the two-pass assembler.
+        `instructions` is consumed as it comes, so the source is never held
+        in memory as a whole
+        """
+        symbols = self.symbols
+        rom = array('H')
+        fixups = []
+
+        for instruction in instructions:
+            if instruction[0] == '(':
+                symbols[instruction[1:-1]] = len(rom)
+
+            elif instruction[0] == '@':
+                address = instruction[1:]
+                if address.isdigit():
+                    rom.append(int(address))
+                elif address in PREDEFINED_SYMBOLS:
+                    rom.append(PREDEFINED_SYMBOLS[address])
+                else:
+                    fixups.append((len(rom), address))
+                    rom.append(0)
+
+            else:
+                try:
+                    rom.append(c_instructions[instruction])
+                except KeyError:
+                    rom.append(parse_c_instruction(instruction))
+
+        return rom, fixups
+
+    def resolve(self, rom, fixups):
+        for rom_address, symbol in fixups:
+            rom[rom_address] = self.parse_symbol(symbol)
+
+    def assemble_file(self, asm_filename):
+        """
+        Like `assemble`, but a program the peephole optimizer can't take,
+        since it addresses its code by number, is read again and assembled
+        unoptimized, with a warning
+        """
+        try:
+            return self.assemble(read_lines(asm_filename))
+        except NumericJumpTarget as error:
+            sys.stderr.write('{}: {}, assembled without peephole '
+                             'optimization\n'.format(asm_filename, error))
+
+        self.peephole = False
+        try:
+            rom = self.assemble(read_lines(asm_filename))
+        finally:
+            self.peephole = True
+        self.optimizer = PeepholeOptimizer()
+        return rom
+
+
+def instruction_addresses(lines):
+    """
+    Returns the ROM address of every source line, counted from 1: the
+    address of the line's instruction, or of the next one for labels,
+    comments and blank lines. The entry past the last line is the ROM size.
+    """
+    addresses = [0]
+    address = 0
+    for line in lines:
+        addresses.append(address)
+        instruction = remove_comments_and_whitespace(line)
+        if instruction and instruction[0] != '(':
+            address += 1
+    addresses.append(address)
+    return addresses
+
+
+def write_rom_map(asm_filename):
+    """
+    Carries the `.vmmap` the VM translator wrote next to `asm_filename`
+    through to ROM addresses, in a `.hackmap` file
+    """
+    # Only imported here, so the assembler does not need semana 08 for
+    # anything else. Its directory goes ahead of the standard library,
+    # which has its own parser module
+    if VM_TRANSLATOR_DIR not in sys.path:
+        sys.path.insert(1, VM_TRANSLATOR_DIR)
+    from source_map import (
+        ROM_ADDRESSES, ROM_MAP_EXTENSION, VM_MAP_EXTENSION, load_source_map)
+
+    filename = os.path.splitext(asm_filename)[0]
+    vm_map = load_source_map(filename + VM_MAP_EXTENSION)
+    addresses = instruction_addresses(read_lines(asm_filename))
+    rom_map = vm_map.remap(addresses.__getitem__, ROM_ADDRESSES)
+    rom_map.save(filename + ROM_MAP_EXTENSION)
+
+
+def write_hack(rom, output_filename):
+    output = open(output_filename, 'w')
+    output.writelines('{:016b}\r\n'.format(word) for word in rom)
+    output.close()
+
+
+def write_outputs(rom, asm_filename, write_bin=False):
+    filename = os.path.splitext(asm_filename)[0]
+    write_hack(rom, filename + '.hack')
+    if write_bin:
+        write_hackbin(rom, filename + HACKBIN_EXTENSION)
+
+
+def build(asm_filename, write_bin=False, cache=None, peephole=False):
+    """
+    Assembles `asm_filename` and writes its outputs next to it, reusing the
+    ROM stored in `cache` when the source has not changed.
+    Returns the number of words and whether they came from the cache
+    """
+    if cache is None:
+        rom = Assembler(peephole).assemble_file(asm_filename)
+        write_outputs(rom, asm_filename, write_bin)
+        return len(rom), False
+
+    key = cache.key(asm_filename)
+    words = cache.fetch(key, os.path.splitext(asm_filename)[0], write_bin)
+    if words is not None:
+        return words, True
+
+    rom = Assembler(peephole).assemble_file(asm_filename)
+    cache.store(key, rom)
+    write_outputs(rom, asm_filename, write_bin)
+    return len(rom), False
+
+
+def find_asm_files(directory):
+    """
+    Returns every `.asm` file under `directory`, recursively, sorted
+    """
+    asm_files = []
+    for root, _, files in os.walk(directory):
+        asm_files.extend(os.path.join(root, file) for file in files
+                         if file.endswith('.asm'))
+    return sorted(asm_files)
+
+
+def _assemble_job(job):
+    """
+    Assembles one file in a worker process.
+    Returns (filename, number of words, cache hit, seconds, error message
+    or None)
+    """
+    asm_filename, write_bin, cache, peephole = job
+    start = time.time()
+    try:
+        words, cached = build(asm_filename, write_bin, cache, peephole)
+    except Exception as error:
+        return (asm_filename, 0, False, time.time() - start,
+                '{}: {}'.format(type(error).__name__, error))
+    return asm_filename, words, cached, time.time() - start, None
+
+
+def assemble_directory(directory, write_bin=False, jobs=None, cache=None,
+                       peephole=False):
+    """
+    Assembles every `.asm` file under `directory` across a pool of worker
+    processes, printing the time taken by each file and a summary.
+    Returns the number of files that failed.
+    """
+    asm_files = find_asm_files(directory)
+    if not asm_files:
+        print 'No .asm files found under {}'.format(directory)
+        return 0
+
+    start = time.time()
+    pool = Pool(jobs or cpu_count())
+    results = pool.imap_unordered(
+        _assemble_job,
+        [(asm_file, write_bin, cache, peephole) for asm_file in asm_files])
+
+    failed = 0
+    hits = 0
+    total_words = 0
+    for asm_filename, words, cached, seconds, error in results:
+        if error:
+            failed += 1
+            print '{:>9.1f} ms  FAILED  {}  ({})'.format(
+                seconds * 1000, asm_filename, error)
+        else:
+            hits += cached
+            total_words += words
+            print '{:>9.1f} ms  {:>6} words  {}{}'.format(
+                seconds * 1000, words, asm_filename,
+                '  (cached)' if cached else '')
+    pool.close()
+    pool.join()
+
+    print '{} files, {} words in {:.2f} s, {} cached, {} failed'.format(
+        len(asm_files), total_words, time.time() - start, hits, failed)
+    return failed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Hack assembler')
+    arg_parser.add_argument('path',
+                            help='.asm file to assemble, or a directory to '
+                                 'assemble every .asm file under it')
+    arg_parser.add_argument('--bin', action='store_true',
+                            help='also write the ROM packed as uint16 words '
+                                 'to a {} file'.format(HACKBIN_EXTENSION))
+    arg_parser.add_argument('-j', '--jobs', type=int,
+                            help='worker processes in directory mode '
+                                 '(defaults to the number of cores)')
+    arg_parser.add_argument('--peephole', action='store_true',
+                            help='run the peephole optimizer before '
+                                 'encoding')
+    arg_parser.add_argument('--cache-dir',
+                            help='where assembled ROMs are cached '
+                                 '(defaults to ~/.cache/hack-assembler)')
+    arg_parser.add_argument('--no-cache', action='store_true',
+                            help='always assemble, without reading or '
+                                 'filling the cache')
+    arg_parser.add_argument('--source-map', action='store_true',
+                            help='carry the .vmmap written by the VM '
+                                 'translator through to ROM addresses, in a '
+                                 '.hackmap file')
+    args = arg_parser.parse_args()
+
+    if args.source_map and (args.peephole or os.path.isdir(args.path)):
+        arg_parser.error('--source-map needs a single .asm file assembled '
+                         'without --peephole')
+
+    if os.path.isdir(args.path):
+        cache = None
+        if not args.no_cache:
+            cache = AssemblyCache(
+                ASSEMBLER_VERSION + ('+peephole' if args.peephole else ''),
+                write_hack, args.cache_dir)
+        if assemble_directory(args.path, args.bin, args.jobs, cache,
+                              args.peephole):
+            sys.exit(1)
+        return
+
+    if args.peephole:
+        assembler = Assembler(peephole=True)
+        rom = assembler.assemble_file(args.path)
+        write_outputs(rom, args.path, args.bin)
+        optimizer = assembler.optimizer
+        print 'Peephole saved {} instructions, {} words left'.format(
+            optimizer.saved, len(rom))
+        for rule, hits in sorted(optimizer.hits.items()):
+            print '  {:<22} {:>6}'.format(rule, hits)
+        return
+
+    cache = None
+    if not args.no_cache:
+        cache = AssemblyCache(ASSEMBLER_VERSION, write_hack, args.cache_dir)
+    build(args.path, args.bin, cache)
+    if args.source_map:
+        write_rom_map(args.path)
+
+
+if __name__ == '__main__':
+    main()
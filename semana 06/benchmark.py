@@ -0,0 +1,196 @@
+"""
+Benchmarks the assembler over the programs in this folder and over
+synthetic programs built by repeating Pong.
+
+Every case runs in a fresh process: first a streaming build to measure
+peak memory, then the phases one at a time (best of --repeat runs).
+Results are printed, or written with --output, as JSON; --baseline
+compares them against an earlier run and fails on a regression.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+from assembler import (
+    ASSEMBLER_VERSION, Assembler, get_instructions, read_lines, write_hack)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+PROGRAMS = [
+    ('Add', 'add/Add.asm'),
+    ('Max', 'max/Max.asm'),
+    ('MaxL', 'max/MaxL.asm'),
+    ('Rect', 'rect/Rect.asm'),
+    ('RectL', 'rect/RectL.asm'),
+    ('Pong', 'pong/Pong.asm'),
+    ('PongL', 'pong/PongL.asm')
+]
+
+# Labels are declared while encoding, in the same pass, so 'encode' includes
+# them; 'resolve' patches the symbol references once every label is known
+PHASES = ['read', 'encode', 'resolve', 'write']
+
+# Smaller programs finish in well under a millisecond, too fast to time
+# reliably, so they are left out of the regression check
+REGRESSION_MIN_INSTRUCTIONS = 1000
+
+
+def write_scaled_program(asm_filename, times, output_filename):
+    """
+    Writes `asm_filename` repeated `times` times. Only the first copy keeps
+    its label declarations, so the copies after it jump back into it and
+    every label still fits in a 15-bit A-instruction.
+    """
+    output = open(output_filename, 'w')
+    for copy in range(times):
+        for line in read_lines(asm_filename):
+            if copy and line.lstrip().startswith('('):
+                continue
+            output.write(line)
+    output.close()
+
+
+def _peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def _run_case(case):
+    """
+    Measures one program in a worker process that runs nothing else
+    """
+    name, asm_filename, repeat, scratch = case
+    hack_filename = os.path.join(scratch, name + '.hack')
+
+    rss_before = _peak_rss_kb()
+    write_hack(Assembler().assemble_file(asm_filename), hack_filename)
+    peak_rss_kb = _peak_rss_kb()
+
+    best = dict((phase, float('inf')) for phase in PHASES)
+    for _ in range(repeat):
+        assembler = Assembler()
+        timings = {}
+
+        start = time.time()
+        instructions = list(get_instructions(read_lines(asm_filename)))
+        timings['read'] = time.time() - start
+
+        start = time.time()
+        rom, fixups = assembler.encode(instructions)
+        timings['encode'] = time.time() - start
+
+        start = time.time()
+        assembler.resolve(rom, fixups)
+        timings['resolve'] = time.time() - start
+
+        start = time.time()
+        write_hack(rom, hack_filename)
+        timings['write'] = time.time() - start
+
+        for phase in PHASES:
+            best[phase] = min(best[phase], timings[phase])
+
+    total = sum(best.values())
+    return name, {
+        'instructions': len(rom),
+        'seconds': dict(best, total=total),
+        'instructions_per_second': len(rom) / total if total else None,
+        'peak_rss_kb': peak_rss_kb,
+        'peak_rss_growth_kb': peak_rss_kb - rss_before
+    }
+
+
+def run(repeat=5, scales=(10, 100)):
+    scratch = tempfile.mkdtemp(prefix='hack-benchmark-')
+    try:
+        cases = [(name, os.path.join(HERE, path), repeat, scratch)
+                 for name, path in PROGRAMS]
+        pong = os.path.join(HERE, 'pong/Pong.asm')
+        for times in scales:
+            name = 'Pong_x{}'.format(times)
+            scaled = os.path.join(scratch, name + '.asm')
+            write_scaled_program(pong, times, scaled)
+            cases.append((name, scaled, repeat, scratch))
+
+        pool = Pool(1, maxtasksperchild=1)
+        results = dict(pool.map(_run_case, cases, chunksize=1))
+        pool.close()
+        pool.join()
+    finally:
+        shutil.rmtree(scratch)
+
+    return {
+        'assembler_version': ASSEMBLER_VERSION,
+        'python': platform.python_version(),
+        'repeat': repeat,
+        'results': results
+    }
+
+
+def find_regressions(report, baseline, threshold):
+    """
+    Returns a message for every program whose instructions per second
+    dropped by more than `threshold` (a fraction) against `baseline`
+    """
+    regressions = []
+    for name, result in sorted(report['results'].items()):
+        if result['instructions'] < REGRESSION_MIN_INSTRUCTIONS:
+            continue
+        previous = baseline['results'].get(name)
+        if not previous or not previous['instructions_per_second']:
+            continue
+        ratio = (result['instructions_per_second'] /
+                 previous['instructions_per_second'])
+        if ratio < 1 - threshold:
+            regressions.append(
+                '{}: {:.0f} -> {:.0f} instructions/s ({:+.1%})'.format(
+                    name, previous['instructions_per_second'],
+                    result['instructions_per_second'], ratio - 1))
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip())
+    arg_parser.add_argument('--repeat', type=int, default=5,
+                            help='runs per program, the best one is kept')
+    arg_parser.add_argument('--scales', type=int, nargs='*',
+                            default=[10, 100],
+                            help='sizes of the synthetic programs, as '
+                                 'multiples of Pong')
+    arg_parser.add_argument('--output', help='write the JSON report here')
+    arg_parser.add_argument('--baseline',
+                            help='JSON report of an earlier run to compare '
+                                 'against')
+    arg_parser.add_argument('--threshold', type=float, default=0.1,
+                            help='slowdown, as a fraction, that counts as a '
+                                 'regression (default 0.1)')
+    args = arg_parser.parse_args()
+
+    report = run(args.repeat, args.scales)
+    report_json = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        output = open(args.output, 'w')
+        output.write(report_json + '\n')
+        output.close()
+    else:
+        print report_json
+
+    if args.baseline:
+        baseline = json.load(open(args.baseline))
+        regressions = find_regressions(report, baseline, args.threshold)
+        for regression in regressions:
+            sys.stderr.write('REGRESSION {}\n'.format(regression))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
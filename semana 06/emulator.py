@@ -0,0 +1,391 @@
+"""
+Hack CPU emulator.
+
+Every ROM word is decoded once, when the program is loaded, into either
+the int loaded by an A-instruction or a tuple describing a C-instruction,
+so the fetch loop never looks at bits again.
+
+CompiledCPU goes further and turns each straight-line run of instructions
+into a generated Python function, executed as a whole.
+"""
+import argparse
+import hashlib
+import os
+import time
+from array import array
+
+from assembler import Assembler
+from hackbin import HACKBIN_EXTENSION, load_hackbin
+from snapshot import SNAPSHOT_EXTENSION, load_snapshot, save_snapshot
+
+ROM_SIZE = 32768
+RAM_SIZE = 32768
+SCREEN = 16384
+KBD = 24576
+
+# Python expression computed by the ALU for each comp code (a-bit plus the
+# six control bits), before truncating it to 16 bits
+COMP_EXPRESSIONS = {
+    0b0101010: '0',
+    0b0111111: '1',
+    0b0111010: '-1',
+    0b0001100: 'd',
+    0b0110000: 'a',
+    0b0001101: '~d',
+    0b0110001: '~a',
+    0b0001111: '-d',
+    0b0110011: '-a',
+    0b0011111: 'd + 1',
+    0b0110111: 'a + 1',
+    0b0001110: 'd - 1',
+    0b0110010: 'a - 1',
+    0b0000010: 'd + a',
+    0b0010011: 'd - a',
+    0b0000111: 'a - d',
+    0b0000000: 'd & a',
+    0b0010101: 'd | a',
+    0b1110000: 'ram[a]',
+    0b1110001: '~ram[a]',
+    0b1110011: '-ram[a]',
+    0b1110111: 'ram[a] + 1',
+    0b1110010: 'ram[a] - 1',
+    0b1000010: 'd + ram[a]',
+    0b1010011: 'd - ram[a]',
+    0b1000111: 'ram[a] - d',
+    0b1000000: 'd & ram[a]',
+    0b1010101: 'd | ram[a]'
+}
+
+# Python condition on the 16-bit ALU output `value` for each jump code
+JUMP_CONDITIONS = {
+    0b001: '0 < value < 0x8000',
+    0b010: 'value == 0',
+    0b011: 'value < 0x8000',
+    0b100: 'value >= 0x8000',
+    0b101: 'value != 0',
+    0b110: 'value == 0 or value >= 0x8000',
+    0b111: 'True'
+}
+
+
+def alu(x, y, control):
+    """
+    Computes the ALU output for any six control bits (zx nx zy ny f no),
+    used for comp codes the assembler never emits
+    """
+    if control & 0b100000:
+        x = 0
+    if control & 0b010000:
+        x = ~x & 0xFFFF
+    if control & 0b001000:
+        y = 0
+    if control & 0b000100:
+        y = ~y & 0xFFFF
+    out = (x + y if control & 0b000010 else x & y) & 0xFFFF
+    if control & 0b000001:
+        out = ~out & 0xFFFF
+    return out
+
+
+def _compile_comp(code):
+    if code in COMP_EXPRESSIONS:
+        return eval('lambda a, d, ram: ({}) & 0xFFFF'.format(
+            COMP_EXPRESSIONS[code]))
+    control = code & 0b111111
+    if code & 0b1000000:
+        return lambda a, d, ram: alu(d, ram[a], control)
+    return lambda a, d, ram: alu(d, a, control)
+
+
+COMPUTATIONS = dict((code, _compile_comp(code)) for code in range(128))
+JUMPS = dict((code, eval('lambda value: ' + condition))
+             for code, condition in JUMP_CONDITIONS.items())
+
+
+def decode(word):
+    """
+    Returns the value loaded by an A-instruction, or
+    (comp, write M, write D, write A, jump or None) for a C-instruction
+    """
+    if not word & 0x8000:
+        return word
+    return (COMPUTATIONS[word >> 6 & 0b1111111],
+            bool(word & 0b001000),
+            bool(word & 0b010000),
+            bool(word & 0b100000),
+            JUMPS.get(word & 0b111))
+
+
+def find_halts(rom):
+    """
+    Addresses of `@n / 0;JMP` loops where n is the address of the
+    A-instruction itself, the idiom Hack programs use to stop
+    """
+    halts = set()
+    for address in range(len(rom) - 1):
+        jump = rom[address + 1]
+        if (rom[address] == address and jump & 0xE000 == 0xE000 and
+                jump & 0b111 == 0b111 and not jump & 0b111000):
+            halts.add(address)
+    return halts
+
+
+def load_rom(filename):
+    """
+    Loads a program from a text `.hack`, a packed `.hackbin` or an `.asm`
+    file, which is assembled first
+    """
+    extension = os.path.splitext(filename)[1]
+    if extension == HACKBIN_EXTENSION:
+        return load_hackbin(filename)
+    if extension == '.asm':
+        return Assembler().assemble_file(filename)
+    rom = array('H')
+    for line in open(filename, 'rU'):
+        line = line.strip()
+        if line:
+            rom.append(int(line, 2))
+    return rom
+
+
+def _comp_source(code):
+    if code in COMP_EXPRESSIONS:
+        expression = COMP_EXPRESSIONS[code]
+        # Only arithmetic and negation can leave the 16-bit range
+        if any(operator in expression for operator in '+-~'):
+            return '({}) & 0xFFFF'.format(expression)
+        return expression
+    operand = 'ram[a]' if code & 0b1000000 else 'a'
+    return 'alu(d, {}, {})'.format(operand, code & 0b111111)
+
+
+def compile_block(rom, entry):
+    """
+    Compiles the instructions from `entry` up to the first jump, or the end
+    of the ROM, into a function (a, d, ram) -> (next pc, a, d).
+    Returns the function and the number of instructions it executes.
+    """
+    lines = ['def block(a, d, ram):']
+    address = entry
+    while address < len(rom):
+        word = rom[address]
+        address += 1
+        if not word & 0x8000:
+            lines.append('    a = {}'.format(word))
+            continue
+
+        comp = _comp_source(word >> 6 & 0b1111111)
+        # M is written at the address held by A before the instruction
+        targets = [target for bit, target in
+                   ((0b001000, 'ram[a]'), (0b010000, 'd'), (0b100000, 'a'))
+                   if word & bit]
+        jump = word & 0b111
+        if jump and 'a' in targets:
+            lines.append('    target = a')
+        if len(targets) == 1 and not jump:
+            lines.append('    {} = {}'.format(targets[0], comp))
+        elif targets or jump:
+            lines.append('    value = {}'.format(comp))
+            lines.extend('    {} = value'.format(target) for target in targets)
+
+        if jump:
+            target = 'target' if 'a' in targets else 'a'
+            if jump == 0b111:
+                lines.append('    return {}, a, d'.format(target))
+            else:
+                lines.append('    if {}:'.format(JUMP_CONDITIONS[jump]))
+                lines.append('        return {}, a, d'.format(target))
+                lines.append('    return {}, a, d'.format(address))
+            break
+    else:
+        lines.append('    return {}, a, d'.format(address))
+
+    namespace = {'alu': alu}
+    exec compile('\n'.join(lines) + '\n', '<block {}>'.format(entry),
+                 'exec') in namespace
+    return namespace['block'], address - entry
+
+
+class _Halt(Exception):
+    pass
+
+
+def _fell_off_rom(a, d, ram):
+    raise _Halt()
+
+
+class CPU(object):
+    """
+    Hack computer with 32K words of ROM and RAM. The screen and keyboard
+    are the RAM words from SCREEN and at KBD, with no device behind them.
+    """
+
+    def __init__(self, rom):
+        if len(rom) > ROM_SIZE:
+            raise ValueError('Program has {} words, the ROM holds {}'.format(
+                len(rom), ROM_SIZE))
+        self.rom = array('H', rom)
+        self.program = [decode(word) for word in self.rom]
+        # Running past the last instruction halts, like a halt loop
+        self.program.append((_fell_off_rom, False, False, False, None))
+        self.halts = find_halts(self.rom)
+        self.ram = array('H', [0]) * RAM_SIZE
+        self.reset()
+
+    def reset(self):
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+        self.halted = False
+        self.cycles = 0
+
+    def step(self):
+        return self.run(1)
+
+    def run(self, max_steps=None):
+        """
+        Executes up to `max_steps` instructions, or until the program halts.
+        Returns the number of instructions executed.
+        """
+        program = self.program
+        halts = self.halts
+        ram = self.ram
+        a, d, pc = self.a, self.d, self.pc
+        steps = 0
+        limit = max_steps if max_steps is not None else float('inf')
+
+        try:
+            while steps < limit:
+                steps += 1
+                operation = program[pc]
+                if operation.__class__ is int:
+                    a = operation
+                    pc += 1
+                    continue
+
+                comp, write_m, write_d, write_a, jump = operation
+                value = comp(a, d, ram)
+                if write_m:
+                    ram[a] = value
+                next_pc = pc + 1
+                if jump is not None and jump(value):
+                    next_pc = a
+                    if a in halts:
+                        self.halted = True
+                        limit = steps
+                if write_d:
+                    d = value
+                if write_a:
+                    a = value
+                pc = next_pc
+        except _Halt:
+            steps -= 1
+            self.halted = True
+
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += steps
+        return steps
+
+
+# Compiled blocks of every ROM loaded by this process, by the ROM's hash
+_compiled_blocks = {}
+
+
+class CompiledCPU(CPU):
+    """
+    CPU that runs straight-line blocks compiled to Python functions.
+    Blocks are compiled the first time execution enters them, so any
+    address reached through a jump starts its own block, and are shared
+    by every CPU holding the same ROM. The ROM cannot be written by a Hack
+    program, so blocks never go stale; the interpreter only takes over when
+    fewer steps are left than the next block executes.
+    """
+
+    def __init__(self, rom):
+        CPU.__init__(self, rom)
+        rom_hash = hashlib.sha1(self.rom.tostring()).hexdigest()
+        self.blocks = _compiled_blocks.setdefault(rom_hash, {})
+
+    def run(self, max_steps=None):
+        blocks = self.blocks
+        halts = self.halts
+        ram = self.ram
+        rom = self.rom
+        a, d, pc = self.a, self.d, self.pc
+        steps = 0
+        limit = max_steps if max_steps is not None else float('inf')
+
+        while True:
+            try:
+                block, length = blocks[pc]
+            except KeyError:
+                if pc >= len(rom):
+                    self.halted = True
+                    break
+                block, length = blocks[pc] = compile_block(rom, pc)
+
+            if steps + length > limit:
+                break
+            pc, a, d = block(a, d, ram)
+            steps += length
+            if pc in halts:
+                self.halted = True
+                break
+
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += steps
+        if not self.halted and steps < limit:
+            steps += CPU.run(self, limit - steps)
+        return steps
+
+
+def _parse_assignment(assignment):
+    address, value = assignment.split('=')
+    return int(address), int(value) & 0xFFFF
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Hack CPU emulator')
+    arg_parser.add_argument('program', help='.hack, {} or .asm file'.format(
+        HACKBIN_EXTENSION))
+    arg_parser.add_argument('--max-steps', type=int, default=10 ** 7,
+                            help='instructions to run at most '
+                                 '(default 10000000)')
+    arg_parser.add_argument('--ram', action='append', default=[],
+                            type=_parse_assignment, metavar='ADDRESS=VALUE',
+                            help='set a RAM word before running')
+    arg_parser.add_argument('--show', default='0:16', metavar='START:END',
+                            help='RAM words to print after running')
+    arg_parser.add_argument('--compiled', action='store_true',
+                            help='compile straight-line blocks to Python '
+                                 'functions instead of interpreting')
+    arg_parser.add_argument('--load-snapshot', metavar='FILE',
+                            help='resume from a {} snapshot of the same '
+                                 'program'.format(SNAPSHOT_EXTENSION))
+    arg_parser.add_argument('--save-snapshot', metavar='FILE',
+                            help='save the registers and RAM after running')
+    args = arg_parser.parse_args()
+
+    cpu = (CompiledCPU if args.compiled else CPU)(load_rom(args.program))
+    if args.load_snapshot:
+        load_snapshot(cpu, args.load_snapshot)
+    for address, value in args.ram:
+        cpu.ram[address] = value
+
+    start = time.time()
+    steps = cpu.run(args.max_steps)
+    seconds = time.time() - start
+    if args.save_snapshot:
+        save_snapshot(cpu, args.save_snapshot)
+
+    print '{} instructions in {:.3f} s ({:.0f}/s), {}'.format(
+        steps, seconds, steps / seconds if seconds else 0,
+        'halted' if cpu.halted else 'stopped')
+    print 'PC={} A={} D={}'.format(cpu.pc, cpu.a, cpu.d)
+    start, end = [int(bound) for bound in args.show.split(':')]
+    for address in range(start, end):
+        print 'RAM[{}] = {}'.format(address, cpu.ram[address])
+
+
+if __name__ == '__main__':
+    main()
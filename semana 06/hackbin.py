@@ -0,0 +1,67 @@
+"""
+Packed ROM format: one little-endian uint16 per instruction, no header.
+"""
+import mmap
+import struct
+import sys
+from array import array
+
+HACKBIN_EXTENSION = '.hackbin'
+
+_word = struct.Struct('<H')
+
+
+def write_hackbin(rom, filename):
+    """
+    Writes the ROM words to `filename` as packed little-endian uint16
+    """
+    words = array('H', rom)
+    if sys.byteorder == 'big':
+        words.byteswap()
+    output = open(filename, 'wb')
+    words.tofile(output)
+    output.close()
+
+
+def load_hackbin(filename):
+    """
+    Reads a `.hackbin` file into an array('H') with a single read
+    """
+    rom = array('H')
+    rom_file = open(filename, 'rb')
+    rom_file.seek(0, 2)
+    size = rom_file.tell()
+    rom_file.seek(0)
+    rom.fromfile(rom_file, size // rom.itemsize)
+    rom_file.close()
+    if sys.byteorder == 'big':
+        rom.byteswap()
+    return rom
+
+
+class MappedROM(object):
+    """
+    Read-only ROM backed by a memory-mapped `.hackbin` file.
+    Words are decoded on access, nothing is copied when loading.
+    """
+
+    def __init__(self, filename):
+        self._file = open(filename, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0,
+                              access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self._map) // _word.size
+
+    def __getitem__(self, address):
+        if not 0 <= address < len(self):
+            raise IndexError('ROM address {} out of range'.format(address))
+        return _word.unpack_from(self._map, address * _word.size)[0]
+
+    def __iter__(self):
+        for address in range(len(self)):
+            yield self[address]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
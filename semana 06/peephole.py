@@ -0,0 +1,127 @@
+"""
+Peephole optimizer for Hack assembly, applied to the instruction stream
+before it is encoded.
+
+Rules rewrite the last few instructions seen. A label declaration is never
+removed and never matched in the middle of a window, so every jump still
+lands on the instruction it did before. Code addresses must be referenced
+through labels only: removing instructions moves every address after them.
+A numeric A-instruction feeding a jump raises `NumericJumpTarget`, since
+a program addressing its code by number may keep any constant as a code
+address (a return address, say); such a program can't be optimized.
+"""
+
+WINDOW_SIZE = 8
+
+POP_PUSH = ['@SP', 'AM=M-1', 'D=M', 'M=0', '@SP', 'M=M+1', 'A=M-1', 'M=D']
+SP_RELOAD = ['@SP', 'AM=M-1', 'D=M', 'M=0', '@SP', 'A=M-1']
+
+
+def _jump_to_next(window):
+    """
+    `@L / 0;JMP / (L)` jumps to the very next instruction
+    """
+    if (len(window) >= 3 and window[-2] == '0;JMP' and
+            window[-3][0] == '@' and
+            window[-1] == '({})'.format(window[-3][1:])):
+        return 3, window[-1:]
+
+
+def _overwritten_a_load(window):
+    """
+    `@X / @Y`: the first load is dead
+    """
+    if len(window) >= 2 and window[-1][0] == '@' and window[-2][0] == '@':
+        return 2, window[-1:]
+
+
+def _overwritten_store(window):
+    """
+    `M=x / M=y`, with y not reading M: the first store is dead
+    """
+    if len(window) >= 2:
+        first, second = window[-2], window[-1]
+        if (first.startswith('M=') and ';' not in first and
+                second.startswith('M=') and 'M' not in second[2:]):
+            return 2, [second]
+
+
+def _pop_push(window):
+    """
+    Popping the stack head to D and pushing D right back only loads D: the
+    zeroed slot is overwritten with the value it held
+    """
+    if window[-len(POP_PUSH):] == POP_PUSH:
+        return len(POP_PUSH), ['@SP', 'A=M-1', 'D=M']
+
+
+def _sp_reload(window):
+    """
+    After `@SP / AM=M-1` A already holds the stack pointer, so reloading it
+    to reach the slot below is `A=A-1`
+    """
+    if window[-len(SP_RELOAD):] == SP_RELOAD:
+        return 2, ['A=A-1']
+
+
+class NumericJumpTarget(ValueError):
+    """
+    The program jumps to a ROM address given by number
+    """
+
+
+RULES = [
+    ('jump to next', _jump_to_next),
+    ('overwritten A load', _overwritten_a_load),
+    ('overwritten store', _overwritten_store),
+    ('pop then push', _pop_push),
+    ('stack pointer reload', _sp_reload)
+]
+
+
+class PeepholeOptimizer(object):
+    """
+    `hits` counts how many times each rule fired and `saved` the
+    instructions removed, once `optimize` has been consumed.
+    """
+
+    def __init__(self):
+        self.hits = dict((name, 0) for name, _ in RULES)
+        self.saved = 0
+
+    def optimize(self, instructions):
+        """
+        Generator that yields the optimized instructions
+        """
+        window = []
+        for instruction in instructions:
+            if (';' in instruction and window and window[-1][0] == '@' and
+                    window[-1][1:].isdigit()):
+                raise NumericJumpTarget(
+                    'jump to a numeric address, {} before {}'.format(
+                        window[-1], instruction))
+
+            window.append(instruction)
+            self._rewrite(window)
+            while len(window) > WINDOW_SIZE:
+                yield window.pop(0)
+
+        for instruction in window:
+            yield instruction
+
+    def _rewrite(self, window):
+        """
+        Applies the rules to the end of the window until none matches
+        """
+        rewritten = True
+        while rewritten:
+            rewritten = False
+            for name, rule in RULES:
+                match = rule(window)
+                if match:
+                    replaced, replacement = match
+                    window[-replaced:] = replacement
+                    self.hits[name] += 1
+                    self.saved += replaced - len(replacement)
+                    rewritten = True
+                    break
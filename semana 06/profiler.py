@@ -0,0 +1,220 @@
+"""
+Per-function cycle profiler for programs translated from VM code.
+
+The function labels of the `.asm` source (`Main.main`, `Ball.move`, ...)
+split the ROM into address ranges, and every instruction executed is
+counted against the function that owns its address. Code before the first
+function, such as the bootstrap and shared runtime routines, is counted as
+`(runtime)`.
+
+Calls and returns are followed through the VM calling convention: a jump
+to a function entry that sets up a new LCL is a call, and a jump that
+leaves LCL below the frame of the running function is a return. That is
+enough to report inclusive cycles and call counts, and to write the call
+stacks in the collapsed format read by flamegraph tools.
+"""
+import argparse
+import time
+from array import array
+
+from assembler import Assembler, get_instructions, read_lines
+from emulator import CPU, _Halt, _parse_assignment
+
+RUNTIME = '(runtime)'
+LCL = 1
+
+
+def is_function_label(label):
+    """
+    VM functions are named `Class.function`. Labels inside a function are
+    scoped as `Class.function$label`, and the translators put helper labels
+    such as return addresses behind a `prefix_`, so neither is a function.
+    """
+    return ('.' in label and '$' not in label and
+            '_' not in label.split('.')[0])
+
+
+def find_functions(asm_filename):
+    """
+    Returns the (ROM address, name) of every function label, in order
+    """
+    functions = []
+    address = 0
+    for instruction in get_instructions(read_lines(asm_filename)):
+        if instruction[0] != '(':
+            address += 1
+        elif is_function_label(instruction[1:-1]):
+            functions.append((address, instruction[1:-1]))
+    return functions
+
+
+class ProfilingCPU(CPU):
+    """
+    Interpreting CPU that counts the instructions executed at each address
+    and the cycles spent under each call stack. `functions` holds the
+    (entry address, name) of each function, sorted by address.
+    """
+
+    def __init__(self, rom, functions):
+        CPU.__init__(self, rom)
+        self.names = [RUNTIME] + [name for _, name in functions]
+        self.entries = dict((address, index + 1)
+                            for index, (address, _) in enumerate(functions))
+        # Function that owns each address, as an index into `names`
+        self.owner = array('H', [0]) * (len(self.rom) + 1)
+        for index, (address, _) in enumerate(functions):
+            end = (functions[index + 1][0] if index + 1 < len(functions)
+                   else len(self.owner))
+            self.owner[address:end] = array('H', [index + 1]) * (end - address)
+
+        self.hits = array('L', [0]) * (len(self.rom) + 1)
+        self.calls = [0] * len(self.names)
+        # Cycles spent under each call stack, as a tuple of name indexes
+        self.stacks = {}
+        self.frames = []
+
+    def _stack_key(self, pc):
+        path = tuple(index for index, _ in self.frames)
+        if self.owner[pc] == 0:
+            path += (0,)
+        return path
+
+    def run(self, max_steps=None):
+        program = self.program
+        halts = self.halts
+        ram = self.ram
+        hits = self.hits
+        owner = self.owner
+        entries = self.entries
+        frames = self.frames
+        stacks = self.stacks
+        a, d, pc = self.a, self.d, self.pc
+        steps = 0
+        mark = 0
+        key = self._stack_key(pc)
+        limit = max_steps if max_steps is not None else float('inf')
+
+        try:
+            while steps < limit:
+                steps += 1
+                hits[pc] += 1
+                operation = program[pc]
+                if operation.__class__ is int:
+                    a = operation
+                    pc += 1
+                    continue
+
+                comp, write_m, write_d, write_a, jump = operation
+                value = comp(a, d, ram)
+                if write_m:
+                    ram[a] = value
+                next_pc = pc + 1
+                if jump is not None and jump(value):
+                    next_pc = a
+                    if a in halts:
+                        self.halted = True
+                        limit = steps
+                    stacks[key] = stacks.get(key, 0) + steps - mark
+                    mark = steps
+
+                    lcl = ram[LCL]
+                    if next_pc in entries:
+                        function = entries[next_pc]
+                        # A loop back to the first instruction keeps LCL
+                        if not frames or frames[-1] != (function, lcl):
+                            frames.append((function, lcl))
+                            self.calls[function] += 1
+                    elif owner[next_pc]:
+                        while len(frames) > 1 and frames[-1][1] > lcl:
+                            frames.pop()
+                    key = self._stack_key(next_pc)
+                if write_d:
+                    d = value
+                if write_a:
+                    a = value
+                pc = next_pc
+        except _Halt:
+            steps -= 1
+            self.halted = True
+
+        stacks[key] = stacks.get(key, 0) + steps - mark
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += steps
+        return steps
+
+    def profile(self):
+        """
+        Returns (name, self cycles, inclusive cycles, calls) for every
+        function that ran, sorted by self cycles
+        """
+        own = [0] * len(self.names)
+        for address, hits in enumerate(self.hits):
+            own[self.owner[address]] += hits
+
+        inclusive = [0] * len(self.names)
+        for path, cycles in self.stacks.items():
+            for index in set(path):
+                inclusive[index] += cycles
+
+        rows = [(self.names[index], own[index], inclusive[index],
+                 self.calls[index])
+                for index in range(len(self.names))
+                if own[index] or inclusive[index]]
+        return sorted(rows, key=lambda row: (-row[1], row[0]))
+
+    def write_collapsed(self, filename):
+        """
+        Writes one `caller;callee cycles` line per call stack
+        """
+        output = open(filename, 'w')
+        for path, cycles in sorted(self.stacks.items()):
+            if cycles:
+                output.write('{} {}\n'.format(
+                    ';'.join(self.names[index] for index in path), cycles))
+        output.close()
+
+
+def print_profile(rows, total, top=None):
+    print '{:>12} {:>6} {:>12} {:>6} {:>8}  {}'.format(
+        'self', '%', 'inclusive', '%', 'calls', 'function')
+    for name, own, inclusive, calls in rows[:top]:
+        print '{:>12} {:>6.1%} {:>12} {:>6.1%} {:>8}  {}'.format(
+            own, float(own) / total, inclusive, float(inclusive) / total,
+            calls, name)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip())
+    arg_parser.add_argument('program', help='.asm file with function labels')
+    arg_parser.add_argument('--max-steps', type=int, default=10 ** 7,
+                            help='instructions to run at most '
+                                 '(default 10000000)')
+    arg_parser.add_argument('--ram', action='append', default=[],
+                            type=_parse_assignment, metavar='ADDRESS=VALUE',
+                            help='set a RAM word before running')
+    arg_parser.add_argument('--top', type=int,
+                            help='print only the first TOP functions')
+    arg_parser.add_argument('--collapsed', metavar='FILE',
+                            help='write the call stacks for flamegraph '
+                                 'tools here')
+    args = arg_parser.parse_args()
+
+    cpu = ProfilingCPU(Assembler().assemble_file(args.program),
+                       find_functions(args.program))
+    for address, value in args.ram:
+        cpu.ram[address] = value
+
+    start = time.time()
+    steps = cpu.run(args.max_steps)
+    seconds = time.time() - start
+
+    print '{} instructions in {:.3f} s, {}'.format(
+        steps, seconds, 'halted' if cpu.halted else 'stopped')
+    if steps:
+        print_profile(cpu.profile(), steps, args.top)
+    if args.collapsed:
+        cpu.write_collapsed(args.collapsed)
+
+
+if __name__ == '__main__':
+    main()
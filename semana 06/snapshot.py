@@ -0,0 +1,70 @@
+"""
+Emulator snapshots: the registers and the whole RAM of a CPU, so a long run
+can be resumed later instead of simulated again.
+
+A snapshot is zlib-compressed: a header with the PC, A and D registers, the
+cycles run so far and the hash of the ROM they ran, followed by the 32K RAM
+words as packed little-endian uint16. A snapshot can only be restored on a
+CPU holding the same ROM.
+"""
+import hashlib
+import struct
+import sys
+import zlib
+from array import array
+
+SNAPSHOT_EXTENSION = '.hacksnap'
+
+_MAGIC = 'HSNP'
+_VERSION = 1
+# magic, version, ROM sha1, PC, A, D, halted, cycles
+_header = struct.Struct('<4sH20sHHH?Q')
+
+
+def _rom_hash(rom):
+    words = array('H', rom)
+    if sys.byteorder == 'big':
+        words.byteswap()
+    return hashlib.sha1(words.tostring()).digest()
+
+
+def save_snapshot(cpu, filename):
+    ram = array('H', cpu.ram)
+    if sys.byteorder == 'big':
+        ram.byteswap()
+    header = _header.pack(_MAGIC, _VERSION, _rom_hash(cpu.rom), cpu.pc,
+                          cpu.a, cpu.d, cpu.halted, cpu.cycles)
+    output = open(filename, 'wb')
+    output.write(zlib.compress(header + ram.tostring()))
+    output.close()
+
+
+def load_snapshot(cpu, filename):
+    """
+    Restores the registers and RAM of `cpu` from `filename`. The RAM is
+    replaced by a new array, read with a single `fromstring`.
+    """
+    snapshot_file = open(filename, 'rb')
+    data = zlib.decompress(snapshot_file.read())
+    snapshot_file.close()
+
+    magic, version, rom_hash, pc, a, d, halted, cycles = \
+        _header.unpack_from(data)
+    if magic != _MAGIC or version != _VERSION:
+        raise Exception('{} is not a version {} snapshot'.format(
+            filename, _VERSION))
+    if rom_hash != _rom_hash(cpu.rom):
+        raise Exception('{} was taken with a different ROM'.format(filename))
+
+    ram = array('H')
+    ram.fromstring(data[_header.size:])
+    if sys.byteorder == 'big':
+        ram.byteswap()
+    if len(ram) != len(cpu.ram):
+        raise Exception('{} holds {} RAM words, the CPU has {}'.format(
+            filename, len(ram), len(cpu.ram)))
+
+    cpu.ram = ram
+    cpu.pc, cpu.a, cpu.d = pc, a, d
+    cpu.halted = halted
+    cpu.cycles = cycles
@@ -0,0 +1,455 @@
+"""
+Headless runner for nand2tetris `.tst` test scripts.
+
+Scripts that load a `.hack` or `.asm` program run on the CPU emulator, the
+ones that load `.vm` code on the VM emulator of semana 08 and the ones that
+load a `.hdl` chip on the HDL simulator of semana 05: compiled into Python
+when it can be, or else as a netlist with the fast models of its RAM,
+Register and PC parts.
+`output-list` columns are formatted like the reference tools do, and the
+output is compared line by line against the script's `.cmp` file, where a
+`*` matches any character. Every script runs in its own worker process
+and the results are printed as a table.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from multiprocessing import Pool, cpu_count
+
+from emulator import CompiledCPU, load_rom
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(HERE)
+
+VM_TRANSLATOR_DIR = os.path.join(REPO_ROOT, 'semana 08', 'VMTranslator')
+HDL_SIMULATOR_DIR = os.path.join(REPO_ROOT, 'semana 05', 'HDLSimulator')
+
+
+def _add_to_path(directory):
+    """
+    Makes the modules of another week importable, ahead of the standard
+    library, which has its own parser module. Only the scripts that need
+    them pay for it
+    """
+    if directory not in sys.path:
+        sys.path.insert(1, directory)
+
+
+PASS = 'PASS'
+FAIL = 'FAIL'
+SKIP = 'SKIP'
+ERROR = 'ERROR'
+
+_COMMENTS = re.compile(r'//[^\n]*|/\*.*?\*/', re.DOTALL)
+_TOKENS = re.compile(r'"[^"]*"|[{},;]|[^\s{},;"]+')
+_OUTPUT_SPEC = re.compile(r'^(.+?)%([BDSX])(\d+)\.(\d+)\.(\d+)$')
+_INDEXED = re.compile(r'^(\w+)\[(\d+)\]$')
+
+# Pointers and fixed bases of the VM segments, as named by the scripts
+VM_POINTERS = {'sp': 0, 'local': 1, 'argument': 2, 'this': 3, 'that': 4}
+VM_FIXED_SEGMENTS = {'RAM': 0, 'pointer': 3, 'temp': 5}
+
+
+class ScriptError(Exception):
+    pass
+
+
+class Unsupported(Exception):
+    pass
+
+
+def parse_script(text):
+    """
+    Returns the commands of a test script. Each command is a list of words,
+    except `repeat`, which becomes ('repeat', count or None, commands).
+    """
+    tokens = _TOKENS.findall(_COMMENTS.sub('', text))
+    commands, position = _parse_commands(tokens, 0)
+    if position != len(tokens):
+        raise ScriptError('Unexpected }')
+    return commands
+
+
+def _parse_commands(tokens, position):
+    commands = []
+    words = []
+    while position < len(tokens):
+        token = tokens[position]
+        position += 1
+        if token in (',', ';'):
+            if words:
+                commands.append(words)
+            words = []
+        elif token == '{':
+            if not words or words[0] not in ('repeat', 'while'):
+                raise ScriptError('Unexpected {')
+            if words[0] == 'while':
+                raise Unsupported('while loops are not supported')
+            count = int(words[1]) if len(words) > 1 else None
+            body, position = _parse_commands(tokens, position)
+            commands.append(('repeat', count, body))
+            words = []
+        elif token == '}':
+            if words:
+                commands.append(words)
+            return commands, position
+        else:
+            words.append(token)
+    if words:
+        commands.append(words)
+    return commands, position
+
+
+def parse_value(text):
+    """
+    Parses a script value: decimal, or %B binary, %X hex, %D decimal
+    """
+    if text.startswith('%B'):
+        value = int(text[2:], 2)
+    elif text.startswith('%X'):
+        value = int(text[2:], 16)
+    elif text.startswith('%D'):
+        value = int(text[2:])
+    else:
+        value = int(text)
+    return value & 0xFFFF
+
+
+class OutputColumn(object):
+
+    def __init__(self, spec):
+        match = _OUTPUT_SPEC.match(spec)
+        if match:
+            self.name, self.kind = match.group(1), match.group(2)
+            self.left, self.width, self.right = [
+                int(size) for size in match.group(3, 4, 5)]
+        else:
+            self.name, self.kind = spec, 'D'
+            self.left, self.width, self.right = 1, 6, 1
+
+    def header(self):
+        size = self.left + self.width + self.right
+        name = self.name[:size]
+        left = (size - len(name)) // 2
+        return ' ' * left + name + ' ' * (size - len(name) - left)
+
+    def cell(self, value):
+        if self.kind == 'D':
+            text = str(value - 0x10000 if value & 0x8000 else value)
+        elif self.kind == 'B':
+            text = '{:016b}'.format(value)
+        elif self.kind == 'X':
+            text = '{:04X}'.format(value)
+        else:
+            # Strings, like the time, are left aligned
+            text = str(value)[:self.width].ljust(self.width)
+        text = text[-self.width:].rjust(self.width)
+        return ' ' * self.left + text + ' ' * self.right
+
+
+class CPUTarget(object):
+    """
+    Script target backed by the CPU emulator
+    """
+
+    def __init__(self, directory, program):
+        self.cpu = CompiledCPU(load_rom(os.path.join(directory, program)))
+
+    def get(self, name):
+        indexed = _INDEXED.match(name)
+        if indexed and indexed.group(1) == 'RAM':
+            return self.cpu.ram[int(indexed.group(2))]
+        if name == 'PC':
+            return self.cpu.pc
+        if name in ('A', 'ARegister'):
+            return self.cpu.a
+        if name in ('D', 'DRegister'):
+            return self.cpu.d
+        if name == 'time':
+            return self.cpu.cycles
+        raise ScriptError('Unknown variable {}'.format(name))
+
+    def set(self, name, value):
+        indexed = _INDEXED.match(name)
+        if indexed and indexed.group(1) == 'RAM':
+            self.cpu.ram[int(indexed.group(2))] = value
+        elif name == 'PC':
+            self.cpu.pc = value
+            self.cpu.halted = False
+        elif name in ('A', 'ARegister'):
+            self.cpu.a = value
+        elif name in ('D', 'DRegister'):
+            self.cpu.d = value
+        else:
+            raise ScriptError('Unknown variable {}'.format(name))
+
+    def step(self, command, times):
+        if command not in ('ticktock', 'tock'):
+            if command == 'tick':
+                return
+            raise ScriptError('{} is not a CPU command'.format(command))
+        self.cpu.run(times)
+
+
+class VMTarget(object):
+    """
+    Script target backed by the VM emulator
+    """
+
+    def __init__(self, directory, program):
+        _add_to_path(VM_TRANSLATOR_DIR)
+        from vm_emulator import VMEmulator, get_vm_files
+
+        self.vm = VMEmulator(get_vm_files(os.path.join(directory, program)))
+
+    def _address(self, name):
+        if name in VM_POINTERS:
+            return VM_POINTERS[name]
+        indexed = _INDEXED.match(name)
+        if indexed:
+            segment, index = indexed.group(1), int(indexed.group(2))
+            if segment in VM_FIXED_SEGMENTS:
+                return VM_FIXED_SEGMENTS[segment] + index
+            if segment in VM_POINTERS:
+                return self.vm.ram[VM_POINTERS[segment]] + index
+        raise ScriptError('Unknown variable {}'.format(name))
+
+    def get(self, name):
+        return self.vm.ram[self._address(name)]
+
+    def set(self, name, value):
+        self.vm.ram[self._address(name)] = value
+
+    def step(self, command, times):
+        if command != 'vmstep':
+            raise ScriptError('{} is not a VM command'.format(command))
+        self.vm.run(times)
+
+
+class HDLTarget(object):
+    """
+    Script target backed by the HDL simulator
+    """
+
+    def __init__(self, directory, program):
+        _add_to_path(HDL_SIMULATOR_DIR)
+        from codegen import CompiledSimulator, load_compiled
+        from hdl_parser import HDLError
+        from netlist import load_netlist
+        from netlist_cache import NetlistCache
+        from simulator import Simulator
+
+        hdl_filename = os.path.join(directory, program)
+        try:
+            self.simulator = CompiledSimulator(load_compiled(hdl_filename))
+        except HDLError:
+            # Builtin parts and the big RAMs run on the netlist instead
+            self.simulator = Simulator(load_netlist(
+                hdl_filename, fast_models=True, cache=NetlistCache()))
+
+    def get(self, name):
+        if name == 'time':
+            return self.simulator.time
+        return self.simulator.get(name)
+
+    def set(self, name, value):
+        self.simulator.set(name, value)
+
+    def step(self, command, times):
+        steps = {
+            'eval': self.simulator.eval,
+            'tick': self.simulator.tick,
+            'tock': self.simulator.tock,
+            'ticktock': self.simulator.clock
+        }
+        if command not in steps:
+            raise ScriptError('{} is not a chip command'.format(command))
+        for _ in range(times):
+            steps[command]()
+
+
+def make_target(directory, words):
+    """
+    Picks the emulator for a `load` command
+    """
+    program = words[1] if len(words) > 1 else ''
+    extension = os.path.splitext(program)[1]
+    if extension in ('.hack', '.asm'):
+        return CPUTarget(directory, program)
+    if extension == '.hdl':
+        return HDLTarget(directory, program)
+    if extension == '.vm' or not program:
+        return VMTarget(directory, program)
+    raise Unsupported('no emulator for "{}"'.format(' '.join(words)))
+
+
+class TestScript(object):
+
+    def __init__(self, tst_filename):
+        self.filename = tst_filename
+        self.directory = os.path.dirname(os.path.abspath(tst_filename))
+        self.commands = parse_script(open(tst_filename, 'rU').read())
+        self.target = None
+        self.columns = []
+        self.header_pending = False
+        self.output = []
+        self.compare_to = None
+        self.output_file = None
+
+    def run(self):
+        self._execute(self.commands)
+        return self.output
+
+    def _execute(self, commands):
+        for command in commands:
+            if command[0] == 'repeat':
+                self._repeat(command[1], command[2])
+            else:
+                self._command(command)
+
+    def _repeat(self, count, body):
+        if count is None:
+            raise Unsupported('repeat without a count runs forever')
+        # A body that only steps the target is run as one long run
+        if len(body) == 1 and len(body[0]) == 1 and body[0][0] != 'output':
+            self.target.step(body[0][0], count)
+            return
+        for _ in range(count):
+            self._execute(body)
+
+    def _command(self, words):
+        name = words[0]
+        if name == 'load':
+            self.target = make_target(self.directory, words)
+        elif name == 'output-file':
+            self.output_file = words[1]
+        elif name == 'compare-to':
+            self.compare_to = words[1]
+        elif name == 'output-list':
+            self.columns = [OutputColumn(spec) for spec in words[1:]]
+            self.header_pending = True
+        elif name == 'set':
+            self.target.set(words[1], parse_value(words[2]))
+        elif name == 'output':
+            self._output()
+        elif name in ('echo', 'clear-echo', 'breakpoint',
+                      'clear-breakpoints'):
+            pass
+        else:
+            self.target.step(name, 1)
+
+    def _output(self):
+        if self.header_pending:
+            self.output.append(
+                '|' + '|'.join(column.header() for column in self.columns) +
+                '|')
+            self.header_pending = False
+        self.output.append(
+            '|' + '|'.join(column.cell(self.target.get(column.name))
+                           for column in self.columns) + '|')
+
+    def write_output(self):
+        if self.output_file:
+            output = open(os.path.join(self.directory, self.output_file), 'w')
+            output.write('\n'.join(self.output) + '\n')
+            output.close()
+
+    def compare(self):
+        """
+        Returns None if the output matches the `.cmp` file, or a message
+        describing the first difference
+        """
+        if not self.compare_to:
+            return None
+        expected = [line.rstrip('\r\n') for line in
+                    open(os.path.join(self.directory, self.compare_to), 'rU')]
+        for number, line in enumerate(self.output):
+            if number >= len(expected):
+                return 'line {}: unexpected {}'.format(number + 1, line)
+            if not _lines_match(line, expected[number]):
+                return 'line {}: expected {} got {}'.format(
+                    number + 1, expected[number].strip(), line.strip())
+        if len(self.output) < len(expected):
+            return 'line {}: missing {}'.format(len(self.output) + 1,
+                                                expected[len(self.output)])
+        return None
+
+
+def _lines_match(line, expected):
+    if len(line) != len(expected):
+        return False
+    return all(want in (got, '*') for got, want in zip(line, expected))
+
+
+def run_test(job):
+    """
+    Runs one script in a worker process.
+    Returns (script, status, message, seconds)
+    """
+    tst_filename, write_out = job
+    start = time.time()
+    try:
+        script = TestScript(tst_filename)
+        script.run()
+        if write_out:
+            script.write_output()
+        difference = script.compare()
+    except Unsupported as reason:
+        return tst_filename, SKIP, str(reason), time.time() - start
+    except Exception as error:
+        return (tst_filename, ERROR, '{}: {}'.format(type(error).__name__,
+                                                     error),
+                time.time() - start)
+    status = FAIL if difference else PASS
+    return tst_filename, status, difference or '', time.time() - start
+
+
+def find_scripts(paths):
+    scripts = []
+    for path in paths:
+        if os.path.isfile(path):
+            scripts.append(path)
+            continue
+        for root, _, files in os.walk(path):
+            scripts.extend(os.path.join(root, file) for file in files
+                           if file.endswith('.tst'))
+    return sorted(scripts)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip())
+    arg_parser.add_argument('paths', nargs='*', default=[REPO_ROOT],
+                            help='.tst files or directories to search '
+                                 '(defaults to the whole repository)')
+    arg_parser.add_argument('-j', '--jobs', type=int,
+                            help='worker processes (defaults to the number '
+                                 'of cores)')
+    arg_parser.add_argument('--write-out', action='store_true',
+                            help="write each script's output-file")
+    args = arg_parser.parse_args()
+
+    scripts = find_scripts(args.paths)
+    start = time.time()
+    pool = Pool(args.jobs or cpu_count())
+    results = pool.map(run_test, [(script, args.write_out)
+                                  for script in scripts], chunksize=1)
+    pool.close()
+    pool.join()
+
+    counts = dict((status, 0) for status in (PASS, FAIL, SKIP, ERROR))
+    for script, status, message, seconds in results:
+        counts[status] += 1
+        print '{:<5} {:>8.1f} ms  {}{}'.format(
+            status, seconds * 1000, os.path.relpath(script),
+            '  ({})'.format(message) if message else '')
+    print '{} passed, {} failed, {} errors, {} skipped in {:.2f} s'.format(
+        counts[PASS], counts[FAIL], counts[ERROR], counts[SKIP],
+        time.time() - start)
+    if counts[FAIL] or counts[ERROR]:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,371 @@
+@256
+D=A
+@SP
+M=D
+
+// call fn Sys.init with locals 0
+@continuation_Sys.init_0
+D=A
+@SP
+M=M+1
+A=M-1
+M=D
+@LCL
+D=M
+@SP
+M=M+1
+A=M-1
+M=D
+@ARG
+D=M
+@SP
+M=M+1
+A=M-1
+M=D
+@THIS
+D=M
+@SP
+M=M+1
+A=M-1
+M=D
+@THAT
+D=M
+@SP
+M=M+1
+A=M-1
+M=D
+@SP
+D=M
+@5
+D=D-A
+@0
+D=D-A
+@ARG
+M=D
+@SP
+D=M
+@LCL
+M=D
+// go handler Sys.init
+@Sys.init
+0;JMP
+// label continuation_Sys.init_0
+(continuation_Sys.init_0)
+
+// declare Sys.init with locals 0// label Sys.init
+(Sys.init)
+
+// push constant 8 
+@8
+D=A
+
+// pop static 0 
+@Sys.vm_0
+M=D
+
+// push constant 1 
+D=1
+
+// pop temp 5 
+@10
+M=D
+
+// push constant 2 
+@2
+D=A
+
+// pop temp 6 
+@11
+M=D
+
+// push constant 3 
+@3
+D=A
+
+// pop temp 7 
+@12
+M=D
+
+// push temp 5 
+@10
+D=M
+
+// push temp 6 
+@SP
+M=M+1
+A=M-1
+M=D
+@11
+D=M
+
+// add 
+@SP
+AM=M-1
+D=D+M
+
+// push temp 7 
+@SP
+M=M+1
+A=M-1
+M=D
+@12
+D=M
+
+// add 
+@SP
+AM=M-1
+D=D+M
+
+// pop static 1 
+@Sys.vm_1
+M=D
+
+// push temp 7 
+@12
+D=M
+
+// pop static 2 
+@Sys.vm_2
+M=D
+
+// call fn Sys.sum with locals 0
+@continuation_Sys.sum_1
+D=A
+@SP
+M=M+1
+A=M-1
+M=D
+@LCL
+D=M
+@SP
+M=M+1
+A=M-1
+M=D
+@ARG
+D=M
+@SP
+M=M+1
+A=M-1
+M=D
+@THIS
+D=M
+@SP
+M=M+1
+A=M-1
+M=D
+@THAT
+D=M
+@SP
+M=M+1
+A=M-1
+M=D
+@SP
+D=M
+@5
+D=D-A
+@0
+D=D-A
+@ARG
+M=D
+@SP
+D=M
+@LCL
+M=D
+// go handler Sys.sum
+@Sys.sum
+0;JMP
+// label continuation_Sys.sum_1
+(continuation_Sys.sum_1)
+
+// pop static 3 
+@SP
+AM=M-1
+D=M
+@Sys.vm_3
+M=D
+
+// push constant 2990 
+@2990
+D=A
+
+// push constant 10 
+@SP
+M=M+1
+A=M-1
+M=D
+@10
+D=A
+
+// add 
+@SP
+AM=M-1
+D=D+M
+
+// push constant 40 
+@SP
+M=M+1
+A=M-1
+M=D
+@40
+D=A
+
+// push constant 2 
+@SP
+M=M+1
+A=M-1
+M=D
+@2
+D=A
+
+// add 
+@SP
+AM=M-1
+D=D+M
+
+// pop temp 5 
+@10
+M=D
+
+// pop pointer 1 
+@SP
+AM=M-1
+D=M
+@4
+M=D
+
+// push temp 5 
+@10
+D=M
+
+// pop that 0 
+@THAT
+A=M
+M=D
+
+// push temp 5 
+@10
+D=M
+
+// pop static 4 
+@Sys.vm_4
+M=D
+
+// label END
+(END)
+
+// go handler END
+@END
+0;JMP
+
+// declare Sys.sum with locals 2// label Sys.sum
+(Sys.sum)
+// push constant 0 
+@0
+D=A
+@SP
+M=M+1
+A=M-1
+M=D
+// push constant 0 
+@0
+D=A
+@SP
+M=M+1
+A=M-1
+M=D
+
+// push constant 300 
+@300
+D=A
+
+// pop local 0 
+@LCL
+A=M
+M=D
+
+// push constant 5 
+@5
+D=A
+
+// pop local 1 
+@LCL
+A=M+1
+M=D
+
+// push local 0 
+@LCL
+A=M
+D=M
+
+// push local 1 
+@SP
+M=M+1
+A=M-1
+M=D
+@LCL
+A=M+1
+D=M
+
+// add 
+@SP
+AM=M-1
+D=D+M
+
+@SP
+M=M+1
+A=M-1
+M=D
+// return
+@LCL
+D=M
+@R13
+M=D
+@5
+D=D-A
+A=D
+D=M
+@R14
+M=D
+@SP
+AM=M-1
+D=M
+M=0
+@ARG
+A=M
+M=D
+D=A+1
+@SP
+M=D
+@R13
+A=M-1
+D=M
+@THAT
+M=D
+@2
+D=A
+@R13
+D=M-D
+A=D
+D=M
+@THIS
+M=D
+@3
+D=A
+@R13
+D=M-D
+A=D
+D=M
+@ARG
+M=D
+@4
+D=A
+@R13
+D=M-D
+A=D
+D=M
+@LCL
+M=D
+@R14
+A=M
+0;JMP
+
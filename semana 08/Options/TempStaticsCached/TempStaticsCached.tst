@@ -0,0 +1,14 @@
+// Translated with --cache-tos.
+
+load TempStaticsCached.asm,
+output-file TempStaticsCached.out,
+compare-to TempStaticsCached.cmp,
+output-list RAM[10]%D1.6.1 RAM[11]%D1.6.1 RAM[12]%D1.6.1 RAM[16]%D1.6.1
+            RAM[17]%D1.6.1 RAM[18]%D1.6.1 RAM[19]%D1.6.1 RAM[20]%D1.6.1
+            RAM[3000]%D1.6.1;
+
+repeat 1000 {
+  ticktock;
+}
+
+output;
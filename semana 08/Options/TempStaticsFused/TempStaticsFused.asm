@@ -0,0 +1,364 @@
+@256
+D=A
+@SP
+M=D
+
+// call fn Sys.init with locals 0
+@continuation_Sys.init_0
+D=A
+@SP
+M=M+1
+A=M-1
+M=D
+@LCL
+D=M
+@SP
+M=M+1
+A=M-1
+M=D
+@ARG
+D=M
+@SP
+M=M+1
+A=M-1
+M=D
+@THIS
+D=M
+@SP
+M=M+1
+A=M-1
+M=D
+@THAT
+D=M
+@SP
+M=M+1
+A=M-1
+M=D
+@SP
+D=M
+@5
+D=D-A
+@0
+D=D-A
+@ARG
+M=D
+@SP
+D=M
+@LCL
+M=D
+// go handler Sys.init
+@Sys.init
+0;JMP
+// label continuation_Sys.init_0
+(continuation_Sys.init_0)
+
+// declare Sys.init with locals 0// label Sys.init
+(Sys.init)
+
+// push; pop
+@8
+D=A
+@Sys.vm_0
+M=D
+
+// push; pop
+D=1
+@10
+M=D
+
+// push; pop
+@2
+D=A
+@11
+M=D
+
+// push; pop
+@3
+D=A
+@12
+M=D
+
+@10
+D=M
+@SP
+M=M+1
+A=M-1
+M=D
+
+@11
+D=M
+@SP
+M=M+1
+A=M-1
+M=D
+
+// add 
+@SP
+AM=M-1
+D=M
+M=0
+@SP
+A=M-1
+M=D+M
+
+@12
+D=M
+@SP
+M=M+1
+A=M-1
+M=D
+
+// add 
+@SP
+AM=M-1
+D=M
+M=0
+@SP
+A=M-1
+M=D+M
+
+// pop from statck to static 1
+@SP
+AM=M-1
+D=M
+M=0
+@Sys.vm_1
+M=D
+// push; pop
+@12
+D=M
+@Sys.vm_2
+M=D
+
+// call fn Sys.sum with locals 0
+@continuation_Sys.sum_1
+D=A
+@SP
+M=M+1
+A=M-1
+M=D
+@LCL
+D=M
+@SP
+M=M+1
+A=M-1
+M=D
+@ARG
+D=M
+@SP
+M=M+1
+A=M-1
+M=D
+@THIS
+D=M
+@SP
+M=M+1
+A=M-1
+M=D
+@THAT
+D=M
+@SP
+M=M+1
+A=M-1
+M=D
+@SP
+D=M
+@5
+D=D-A
+@0
+D=D-A
+@ARG
+M=D
+@SP
+D=M
+@LCL
+M=D
+// go handler Sys.sum
+@Sys.sum
+0;JMP
+// label continuation_Sys.sum_1
+(continuation_Sys.sum_1)
+
+// pop from statck to static 3
+@SP
+AM=M-1
+D=M
+M=0
+@Sys.vm_3
+M=D
+// push constant 2990 
+@2990
+D=A
+@SP
+M=M+1
+A=M-1
+M=D
+
+// push constant; add
+@10
+D=A
+@SP
+A=M-1
+M=M+D
+
+// push constant 40 
+@40
+D=A
+@SP
+M=M+1
+A=M-1
+M=D
+
+// push constant; add
+@2
+D=A
+@SP
+A=M-1
+M=M+D
+
+// array store
+@SP
+AM=M-1
+D=M
+@10
+M=D
+@SP
+AM=M-1
+D=M
+@4
+M=D
+@10
+D=M
+@THAT
+A=M
+M=D
+
+// push; pop
+@10
+D=M
+@Sys.vm_4
+M=D
+
+// label END
+(END)
+
+// go handler END
+@END
+0;JMP
+
+// declare Sys.sum with locals 2// label Sys.sum
+(Sys.sum)
+// push constant 0 
+@0
+D=A
+@SP
+M=M+1
+A=M-1
+M=D
+// push constant 0 
+@0
+D=A
+@SP
+M=M+1
+A=M-1
+M=D
+
+// push; pop
+@300
+D=A
+@LCL
+A=M
+M=D
+
+// push; pop
+@5
+D=A
+@LCL
+A=M+1
+M=D
+
+// push from segment LCL to stack 0 
+@0
+D=A
+@LCL
+A=M+D
+D=M
+@SP
+M=M+1
+A=M-1
+M=D
+
+// push from segment LCL to stack 1 
+@1
+D=A
+@LCL
+A=M+D
+D=M
+@SP
+M=M+1
+A=M-1
+M=D
+
+// add 
+@SP
+AM=M-1
+D=M
+M=0
+@SP
+A=M-1
+M=D+M
+
+// return
+@LCL
+D=M
+@R13
+M=D
+@5
+D=D-A
+A=D
+D=M
+@R14
+M=D
+@SP
+AM=M-1
+D=M
+M=0
+@ARG
+A=M
+M=D
+D=A+1
+@SP
+M=D
+@R13
+A=M-1
+D=M
+@THAT
+M=D
+@2
+D=A
+@R13
+D=M-D
+A=D
+D=M
+@THIS
+M=D
+@3
+D=A
+@R13
+D=M-D
+A=D
+D=M
+@ARG
+M=D
+@4
+D=A
+@R13
+D=M-D
+A=D
+D=M
+@LCL
+M=D
+@R14
+A=M
+0;JMP
+
@@ -0,0 +1,14 @@
+load,  // Load all the VM files from the current directory.
+output-file TempStaticsFused.out,
+compare-to TempStaticsFused.cmp,
+output-list RAM[10]%D1.6.1 RAM[11]%D1.6.1 RAM[12]%D1.6.1 RAM[16]%D1.6.1
+            RAM[17]%D1.6.1 RAM[18]%D1.6.1 RAM[19]%D1.6.1 RAM[20]%D1.6.1
+            RAM[3000]%D1.6.1;
+
+set sp 256,
+
+repeat 60 {
+  vmstep;
+}
+
+output;
@@ -0,0 +1,14 @@
+// Translated with --fuse --cache-tos.
+
+load TempStaticsFusedCached.asm,
+output-file TempStaticsFusedCached.out,
+compare-to TempStaticsFusedCached.cmp,
+output-list RAM[10]%D1.6.1 RAM[11]%D1.6.1 RAM[12]%D1.6.1 RAM[16]%D1.6.1
+            RAM[17]%D1.6.1 RAM[18]%D1.6.1 RAM[19]%D1.6.1 RAM[20]%D1.6.1
+            RAM[3000]%D1.6.1;
+
+repeat 1000 {
+  ticktock;
+}
+
+output;
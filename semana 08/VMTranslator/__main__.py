@@ -1,6 +1,11 @@
 import sys
 import os
-from parser import parse_gen
+from fusion import Fuser
+from helpers import count_instructions
+from parser import parse_ir
+from runtime import runtime_routines
+from source_map import ASM_LINES, VM_MAP_EXTENSION, SourceMap
+from stack_cache import StackCache
 from starter import program_starter, stack_initializer
 from writer import assembly_command_constructor
 
@@ -41,15 +46,79 @@ def _get_output_filename(arg):
 if __name__ != '__main__':
     print 'Please run as a self-conatined program'
 
-vm_files = _get_vm_files(sys.argv[1])
-output_file = open(_get_output_filename(sys.argv[1]), 'w')
-output_file.write(stack_initializer() + '\n')
-output_file.write(program_starter() + '\n')
-
-for file in vm_files:
-    parser = parse_gen(file)
-    file_name = file.split('/')[-1]
-    for command_type, arg1, arg2 in parser:
-        assembly_command = \
-            assembly_command_constructor(command_type, arg1, arg2, file_name)
-        output_file.write(assembly_command + '\n')
+def _plain_size(programs):
+    """
+    Instructions the program takes translated without any of the options
+    that change the code generated
+    """
+    size = count_instructions(stack_initializer() + program_starter())
+    for file_name, commands in programs:
+        for command in commands:
+            size += count_instructions(assembly_command_constructor(
+                command.command_type, command.arg1, command.arg2, file_name))
+    return size
+
+
+vm_files = list(_get_vm_files(sys.argv[1]))
+output_filename = _get_output_filename(sys.argv[1])
+# Every file is parsed once, to the commands of the IR in `ir`
+programs = [(file.split('/')[-1], parse_ir(file)) for file in vm_files]
+
+# With --shared-calls, call and return sites jump to a single $$CALL and
+# $$RETURN routine, and with --shared-comparisons eq, gt and lt jump to a
+# routine for each. The routines are placed after the bootstrap
+shared_calls = '--shared-calls' in sys.argv[2:]
+shared_comparisons = '--shared-comparisons' in sys.argv[2:]
+bootstrap = stack_initializer() + '\n' + program_starter(shared_calls) + '\n'
+bootstrap += runtime_routines(shared_calls, shared_comparisons)
+# With --cache-tos, the top of the stack is kept in D between commands
+cache_tos = '--cache-tos' in sys.argv[2:]
+stack_cache = StackCache(shared_calls, shared_comparisons) \
+    if cache_tos else None
+# With --fuse, common sequences of commands are translated as one
+fuser = Fuser(assembly_command_constructor) \
+    if '--fuse' in sys.argv[2:] else None
+
+# With --source-map, every command is mapped to its first line of assembly
+source_map = SourceMap(ASM_LINES) if '--source-map' in sys.argv[2:] else None
+asm_line = bootstrap.count('\n') + 1
+
+# The assembly of every command is collected and written in one go
+output = [bootstrap]
+for file_name, commands in programs:
+    if fuser is not None:
+        commands = fuser.fuse(commands, file_name)
+    for command in commands:
+        if stack_cache is not None:
+            assembly_command = stack_cache.command(
+                command.command_type, command.arg1, command.arg2, file_name)
+        else:
+            assembly_command = assembly_command_constructor(
+                command.command_type, command.arg1, command.arg2, file_name,
+                shared_calls, shared_comparisons)
+        output.append(assembly_command)
+        output.append('\n')
+        if source_map is not None:
+            source_map.add(asm_line, file_name, command.line, command.text)
+            asm_line += assembly_command.count('\n') + 1
+    if stack_cache is not None and stack_cache.cached:
+        flush = stack_cache.flush()
+        output.append(flush)
+        output.append('\n')
+        asm_line += flush.count('\n') + 1
+
+assembly = ''.join(output)
+output_file = open(output_filename, 'w')
+output_file.write(assembly)
+output_file.close()
+if shared_calls or shared_comparisons or cache_tos or fuser is not None:
+    size = count_instructions(assembly)
+    plain_size = _plain_size(programs)
+    print '{}: {} instructions, {} without the size options ' \
+        '({:+.1%})'.format(output_filename, size, plain_size,
+                           float(size) / plain_size - 1)
+if fuser is not None:
+    print fuser.table()
+if source_map is not None:
+    source_map.end = asm_line
+    source_map.save(os.path.splitext(output_filename)[0] + VM_MAP_EXTENSION)
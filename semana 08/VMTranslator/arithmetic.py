@@ -1,4 +1,5 @@
 from helpers import load_stack_head_to_D
+from runtime import shared_compare
 
 label_counter = 0
 
@@ -71,6 +72,14 @@ def _compare(assembly_comp):
             '(' + continue_label + ')\n')
 
 
+def _shared_compare(comparison):
+    global label_counter
+
+    continue_label = 'CONTINUE_{}'.format(label_counter)
+    label_counter += 1
+    return shared_compare(comparison, continue_label)
+
+
 def _eq_handler():
     return _compare('JEQ')
 
@@ -93,7 +102,9 @@ def _not_handler():
             'M=!M\n')
 
 
-def arithmetic_handler(type):
+def arithmetic_handler(type, shared_comparisons=False):
+    if shared_comparisons and type in ('eq', 'gt', 'lt'):
+        return '// {} \n{}'.format(type, _shared_compare(type))
     return '// {} \n{}'.format(type, {
         'add': _add_handler,
         'sub': _sub_handler,
@@ -7,3 +7,4 @@ FUNCTION = 'C_FUNCTION'
 LABEL = 'C_LABEL'
 CALL = 'C_CALL'
 RETURN = 'C_RETURN'
+FUSED = 'C_FUSED'
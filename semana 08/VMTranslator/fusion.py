@@ -0,0 +1,242 @@
+from command_types import ARITHMETIC, FUSED, IF, POP, PUSH
+from helpers import count_instructions, pop_stack_head_to_D
+from ir import Command
+from memory_access import (CONSTANT, POINTER, TEMP, THAT, load_segment_to_D,
+                           store_D_to_segment)
+
+# Jump taken by `if-goto` after each comparison, and after its negation
+BRANCH_JUMPS = {
+    'eq': ('JEQ', 'JNE'),
+    'gt': ('JGT', 'JLE'),
+    'lt': ('JLT', 'JGE')
+}
+
+# Commands looked ahead, the length of the longest fusion
+WINDOW = 4
+
+
+def _is(command, command_type, arg1=None, arg2=None):
+    return (command.command_type == command_type and
+            arg1 in (None, command.arg1) and
+            arg2 in (None, command.arg2))
+
+
+def _match_array_store(commands):
+    """
+    pop temp t; pop pointer 1; push temp t; pop that k
+    """
+    pop_temp, pop_pointer, push_temp, pop_that = commands
+    return (_is(pop_temp, POP, TEMP) and
+            _is(pop_pointer, POP, POINTER, 1) and
+            _is(push_temp, PUSH, TEMP, pop_temp.arg2) and
+            _is(pop_that, POP, THAT))
+
+
+def _array_store(commands, file):
+    temp, index = commands[0].arg2, commands[3].arg2
+    return (pop_stack_head_to_D() +
+            store_D_to_segment(TEMP, temp, file) +
+            pop_stack_head_to_D() +
+            store_D_to_segment(POINTER, 1, file) +
+            load_segment_to_D(TEMP, temp, file) +
+            store_D_to_segment(THAT, index, file))
+
+
+def _match_array_load(commands):
+    """
+    add; pop pointer 1; push that k
+    """
+    add, pop_pointer, push_that = commands
+    return (_is(add, ARITHMETIC, 'add') and
+            _is(pop_pointer, POP, POINTER, 1) and
+            _is(push_that, PUSH, THAT))
+
+
+def _array_load(commands, file):
+    return (pop_stack_head_to_D() +
+            'A=A-1\n' +
+            'D=D+M\n' +
+            store_D_to_segment(POINTER, 1, file) +
+            load_segment_to_D(THAT, commands[2].arg2, file) +
+            '@SP\n' +
+            'A=M-1\n' +
+            'M=D\n')
+
+
+def _match_compare_not_branch(commands):
+    """
+    eq, gt or lt; not; if-goto L
+    """
+    compare, negate, branch = commands
+    return (compare.command_type == ARITHMETIC and
+            compare.arg1 in BRANCH_JUMPS and
+            _is(negate, ARITHMETIC, 'not') and
+            _is(branch, IF))
+
+
+def _branch_on_comparison(comparison, label, negated):
+    return (pop_stack_head_to_D() +
+            '@SP\n' +
+            'AM=M-1\n' +
+            'D=M-D\n' +
+            '@{}\n'.format(label) +
+            'D;{}\n'.format(BRANCH_JUMPS[comparison][negated]))
+
+
+def _compare_not_branch(commands, file):
+    return _branch_on_comparison(commands[0].arg1, commands[2].arg1, True)
+
+
+def _match_compare_branch(commands):
+    """
+    eq, gt or lt; if-goto L
+    """
+    compare, branch = commands
+    return (compare.command_type == ARITHMETIC and
+            compare.arg1 in BRANCH_JUMPS and
+            _is(branch, IF))
+
+
+def _compare_branch(commands, file):
+    return _branch_on_comparison(commands[0].arg1, commands[1].arg1, False)
+
+
+def _match_not_branch(commands):
+    """
+    not; if-goto L
+    """
+    negate, branch = commands
+    return _is(negate, ARITHMETIC, 'not') and _is(branch, IF)
+
+
+def _not_branch(commands, file):
+    label = commands[1].arg1
+    return ('@SP\n' +
+            'AM=M-1\n' +
+            'D=!M\n' +
+            '@{}\n'.format(label) +
+            'D;JNE\n')
+
+
+def _match_constant_operation(operation):
+    """
+    push constant n; `operation`
+    """
+    def matches(commands):
+        push, arithmetic = commands
+        return (_is(push, PUSH, CONSTANT) and
+                _is(arithmetic, ARITHMETIC, operation))
+    return matches
+
+
+def _constant_operation(commands, file):
+    value = commands[0].arg2
+    sign = '+' if commands[1].arg1 == 'add' else '-'
+    if value == 1:
+        return ('@SP\n' +
+                'A=M-1\n' +
+                'M=M{}1\n'.format(sign))
+    return ('@{}\n'.format(value) +
+            'D=A\n' +
+            '@SP\n' +
+            'A=M-1\n' +
+            'M=M{}D\n'.format(sign))
+
+
+def _match_move(commands):
+    """
+    push X; pop Y
+    """
+    push, pop = commands
+    return _is(push, PUSH) and _is(pop, POP)
+
+
+def _move(commands, file):
+    push, pop = commands
+    return (load_segment_to_D(push.arg1, push.arg2, file) +
+            store_D_to_segment(pop.arg1, pop.arg2, file))
+
+
+# (name, length, matcher, handler) of every fusion, the longest first so
+# they win over the fusions they contain
+FUSIONS = [
+    ('array store', 4, _match_array_store, _array_store),
+    ('array load', 3, _match_array_load, _array_load),
+    ('compare; not; if-goto', 3, _match_compare_not_branch,
+     _compare_not_branch),
+    ('compare; if-goto', 2, _match_compare_branch, _compare_branch),
+    ('not; if-goto', 2, _match_not_branch, _not_branch),
+    ('push constant; add', 2, _match_constant_operation('add'),
+     _constant_operation),
+    ('push constant; sub', 2, _match_constant_operation('sub'),
+     _constant_operation),
+    ('push; pop', 2, _match_move, _move)
+]
+
+FUSION_HANDLERS = dict((name, handler) for name, _, _, handler in FUSIONS)
+
+
+def fused_handler(name, commands, file):
+    return ('// {}\n'.format(name) +
+            FUSION_HANDLERS[name](commands, file))
+
+
+class Fuser(object):
+    """
+    Replaces the sequences of `Command`s a fusion matches by a single FUSED
+    command. Keeps count of the fusions made and, when given the function
+    that translates a single command, of the instructions they saved
+    """
+
+    def __init__(self, translate=None):
+        self.translate = translate
+        self.hits = dict((name, 0) for name in FUSION_HANDLERS)
+        self.saved = dict((name, 0) for name in FUSION_HANDLERS)
+
+    def _match(self, window):
+        for name, length, matches, _ in FUSIONS:
+            if len(window) >= length and matches(window[:length]):
+                return name, length
+        return None, 1
+
+    def _next(self, window, file):
+        name, length = self._match(window)
+        matched = window[:length]
+        del window[:length]
+        if name is None:
+            return matched[0]
+
+        self.hits[name] += 1
+        if self.translate is not None:
+            self.saved[name] += sum(
+                count_instructions(self.translate(
+                    command.command_type, command.arg1, command.arg2, file))
+                for command in matched)
+            self.saved[name] -= count_instructions(
+                fused_handler(name, matched, file))
+        text = '; '.join(command.text for command in matched)
+        return Command(matched[0].line, text, FUSED, name, matched)
+
+    def fuse(self, commands, file):
+        """
+        Generator over `commands` with the sequences fused
+        """
+        window = []
+        for command in commands:
+            window.append(command)
+            if len(window) == WINDOW:
+                yield self._next(window, file)
+        while window:
+            yield self._next(window, file)
+
+    def table(self):
+        """
+        Hits and instructions saved of every fusion, the ones that saved
+        the most first
+        """
+        lines = ['{:<24}{:>8}{:>8}'.format('fusion', 'hits', 'saved')]
+        for name in sorted(self.hits, key=lambda name: (-self.saved[name],
+                                                        -self.hits[name])):
+            lines.append('{:<24}{:>8}{:>8}'.format(name, self.hits[name],
+                                                   self.saved[name]))
+        return '\n'.join(lines)
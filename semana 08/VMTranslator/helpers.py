@@ -14,3 +14,25 @@ def load_stack_head_to_D():
             'AM=M-1\n' +
             'D=M\n' +
             'M=0\n')
+
+
+def pop_stack_head_to_D():
+    """
+    Like `load_stack_head_to_D`, without clearing the slot popped
+    """
+    return ('@SP\n' +
+            'AM=M-1\n' +
+            'D=M\n')
+
+
+def count_instructions(assembly):
+    """
+    Number of Hack instructions in assembly code, leaving out comments,
+    labels and blank lines
+    """
+    count = 0
+    for line in assembly.split('\n'):
+        line = line.split('//')[0].strip()
+        if line and not line.startswith('('):
+            count += 1
+    return count
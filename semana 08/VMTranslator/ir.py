@@ -0,0 +1,27 @@
+"""
+Compact representation of parsed VM commands, which the translator works
+on instead of the text of each command.
+"""
+
+
+class Command(object):
+    """
+    A VM command. `command_type` is one of the constants in
+    `command_types`, `arg1` an interned string and `arg2` an int, or None
+    when the command does not take them. `line` and `text` locate the
+    command in its `.vm` file.
+
+    A FUSED command has the name of its fusion as `arg1` and the commands
+    fused as `arg2`.
+    """
+    __slots__ = ('line', 'text', 'command_type', 'arg1', 'arg2')
+
+    def __init__(self, line, text, command_type, arg1=None, arg2=None):
+        self.line = line
+        self.text = text
+        self.command_type = command_type
+        self.arg1 = arg1
+        self.arg2 = arg2
+
+    def __repr__(self):
+        return 'Command({!r})'.format(self.text)
@@ -18,6 +18,10 @@ BIN_SEGMENT_FOR_ASM_SEGMENT = {
     THIS: 'THIS'
 }
 
+# Past this index a segment slot is stored to through R13 and R14 rather
+# than a chain of A=A+1
+MAX_CHAINED_INDEX = 9
+
 
 def _push_constant_to_stack(val):
     """
@@ -71,6 +75,92 @@ def push_handler(segment, val, file):
         raise Exception('Incorrect segment {}'.format(segment))
 
 
+def _register(segment, index, file):
+    """
+    The address or static variable `segment index` lives in, or None for
+    the segments addressed through a pointer. Addresses are numeric, like
+    in `push_handler`, since the assembler does not predefine `R10`
+    """
+    if segment == POINTER:
+        return str(3 + int(index))
+    if segment == TEMP:
+        return str(5 + int(index))
+    if segment == STATIC:
+        return '{}_{}'.format(file, index)
+    return None
+
+
+def _segment_slot(segment, index):
+    """
+    Points A to slot `index` of a segment without using D
+    """
+    index = int(index)
+    if index == 0:
+        return ('@{}\n'.format(segment) +
+                'A=M\n')
+    return ('@{}\n'.format(segment) +
+            'A=M+1\n' +
+            'A=A+1\n' * (index - 1))
+
+
+def load_segment_to_D(segment, index, file):
+    """
+    Assigns to D the value of `segment index`, without going through the
+    stack
+    """
+    register = _register(segment, index, file)
+    if register is not None:
+        return ('@{}\n'.format(register) +
+                'D=M\n')
+    if segment == CONSTANT:
+        if int(index) in (0, 1):
+            return 'D={}\n'.format(index)
+        return ('@{}\n'.format(index) +
+                'D=A\n')
+    if segment not in BIN_SEGMENT_FOR_ASM_SEGMENT:
+        raise Exception('Incorrect segment {}'.format(segment))
+    segment = BIN_SEGMENT_FOR_ASM_SEGMENT[segment]
+    if int(index) < 2:
+        return (_segment_slot(segment, index) +
+                'D=M\n')
+    return ('@{}\n'.format(index) +
+            'D=A\n' +
+            '@{}\n'.format(segment) +
+            'A=D+M\n' +
+            'D=M\n')
+
+
+def store_D_to_segment(segment, index, file):
+    """
+    Assigns the value of D to `segment index`, without going through the
+    stack
+    """
+    register = _register(segment, index, file)
+    if register is not None:
+        return ('@{}\n'.format(register) +
+                'M=D\n')
+    if segment not in BIN_SEGMENT_FOR_ASM_SEGMENT:
+        raise Exception('Incorrect segment {} for pop command'.format(
+            segment))
+    segment = BIN_SEGMENT_FOR_ASM_SEGMENT[segment]
+    if int(index) <= MAX_CHAINED_INDEX:
+        return (_segment_slot(segment, index) +
+                'M=D\n')
+    return ('@R13\n' +
+            'M=D\n' +  # Keep the value while the address is computed
+            '@{}\n'.format(index) +
+            'D=A\n' +
+            '@{}\n'.format(segment) +
+            'D=D+M\n' +
+            '@R14\n' +
+            'M=D\n' +
+            '@R13\n' +
+            'D=M\n' +
+            '@R14\n' +
+            'A=M\n' +
+            'M=D\n')
+
+
 def _from_stack_to_memory_transporter(segment, index):
     return ('// pop from stack to segment {} {} \n'.format(segment, index) +
             '@{}\n'.format(index) +
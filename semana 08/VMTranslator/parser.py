@@ -1,5 +1,6 @@
 from command_types import (
     ARITHMETIC, CALL, FUNCTION, GOTO, IF, LABEL, POP, PUSH, RETURN)
+from ir import Command
 
 
 def _remove_comments_and_whitespace(line):
@@ -56,15 +57,16 @@ def _get_second_arg(split_command, command_type):
                 'Invalid vm command: {}'.format(' '.join(split_command)))
 
 
-# ############ Only function to be exported ############ #
+# ############ Exported functions ############ #
 
-def parse_gen(file):
+def parse_lines_gen(file):
     """
-    Generator that outputs a triplete for each command in a `.vm` file
+    Generator that outputs the line number, the text and the triplete of
+    each command in a `.vm` file
     """
     vm_file = open(file, 'r')
 
-    for line in vm_file.readlines():
+    for line_number, line in enumerate(vm_file.readlines(), 1):
         command = _remove_comments_and_whitespace(line)
         if not command:
             continue
@@ -73,4 +75,32 @@ def parse_gen(file):
         arg1 = _get_first_arg(split_command, command_type)
         arg2 = _get_second_arg(split_command, command_type)
 
-        yield command_type, arg1, arg2
+        yield line_number, command, (command_type, arg1, arg2)
+
+
+def parse_gen(file):
+    """
+    Generator that outputs a triplete for each command in a `.vm` file
+    """
+    for _, _, command in parse_lines_gen(file):
+        yield command
+
+
+def parse_ir(file):
+    """
+    List of the `Command`s in a `.vm` file, with their first argument
+    interned and their second converted to an int
+    """
+    commands = []
+    for line_number, command, (command_type, arg1, arg2) in \
+            parse_lines_gen(file):
+        if arg1 is not None:
+            arg1 = intern(arg1)
+        if arg2 is not None:
+            try:
+                arg2 = int(arg2)
+            except ValueError:
+                raise Exception('Invalid vm command: {}'.format(command))
+        commands.append(Command(line_number, command, command_type, arg1,
+                                arg2))
+    return commands
@@ -0,0 +1,178 @@
+from helpers import load_stack_head_to_D, push_D_to_stack
+
+CALL_ROUTINE = '$$CALL'
+RETURN_ROUTINE = '$$RETURN'
+
+# Comparison routine of each VM comparison, with the jump that makes it true
+COMPARE_ROUTINES = {
+    'eq': ('$$EQ', 'JEQ'),
+    'gt': ('$$GT', 'JGT'),
+    'lt': ('$$LT', 'JLT')
+}
+
+# Register a comparison routine keeps its return address in
+COMPARE_RETURN_ADDRESS = 'R15'
+
+# Registers a call site passes to CALL_ROUTINE
+CALL_TARGET = 'R13'
+CALL_NUM_ARGS = 'R14'
+CALL_RETURN_ADDRESS = 'R15'
+
+
+def shared_call(function_name, num_args, continuation_address):
+    """
+    Call site that hands the target, the number of arguments and the
+    return address to CALL_ROUTINE in R13-R15
+    """
+    return ('// call fn {} with args {}\n'.format(function_name, num_args) +
+            '@{}\n'.format(continuation_address) +
+            'D=A\n' +
+            '@{}\n'.format(CALL_RETURN_ADDRESS) +
+            'M=D\n' +
+            '@{}\n'.format(num_args) +
+            'D=A\n' +
+            '@{}\n'.format(CALL_NUM_ARGS) +
+            'M=D\n' +
+            '@{}\n'.format(function_name) +
+            'D=A\n' +
+            '@{}\n'.format(CALL_TARGET) +
+            'M=D\n' +
+            '@{}\n'.format(CALL_ROUTINE) +
+            '0;JMP\n' +
+            '({})\n'.format(continuation_address))
+
+
+def shared_return():
+    return ('// return\n' +
+            '@{}\n'.format(RETURN_ROUTINE) +
+            '0;JMP\n')
+
+
+def _push_register(register):
+    return ('@{}\n'.format(register) +
+            'D=M\n' +
+            push_D_to_stack())
+
+
+def call_routine():
+    """
+    Pushes the caller's frame, repositions ARG and LCL and jumps to the
+    function in R13
+    """
+    return ('// shared call routine\n'
+            '({})\n'.format(CALL_ROUTINE) +
+            _push_register(CALL_RETURN_ADDRESS) +
+            _push_register('LCL') +
+            _push_register('ARG') +
+            _push_register('THIS') +
+            _push_register('THAT') +
+            '@SP\n'
+            'D=M\n'
+            '@5\n'
+            'D=D-A\n'
+            '@{}\n'.format(CALL_NUM_ARGS) +
+            'D=D-M\n'
+            '@ARG\n'
+            'M=D\n'  # ARG = SP - 5 - nArgs
+            '@SP\n'
+            'D=M\n'
+            '@LCL\n'
+            'M=D\n'  # LCL = SP
+            '@{}\n'.format(CALL_TARGET) +
+            'A=M\n'
+            '0;JMP\n')
+
+
+def _restore_from_frame(register):
+    """
+    Restores `register` from the frame walked down from R13
+    """
+    return ('@R13\n'
+            'AM=M-1\n'
+            'D=M\n'
+            '@{}\n'.format(register) +
+            'M=D\n')
+
+
+def return_routine():
+    """
+    Moves the return value to ARG[0], restores the caller's frame and jumps
+    back to the return address
+    """
+    return ('// shared return routine\n'
+            '({})\n'.format(RETURN_ROUTINE) +
+            '@LCL\n'
+            'D=M\n'
+            '@R13\n'
+            'M=D\n'  # R13 = frame
+            '@5\n'
+            'A=D-A\n'
+            'D=M\n'
+            '@R14\n'
+            'M=D\n'  # R14 = return address
+            '@SP\n'
+            'AM=M-1\n'
+            'D=M\n'
+            '@ARG\n'
+            'A=M\n'
+            'M=D\n'  # ARG[0] = return value
+            'D=A+1\n'
+            '@SP\n'
+            'M=D\n'  # SP = ARG + 1
+            + _restore_from_frame('THAT') +
+            _restore_from_frame('THIS') +
+            _restore_from_frame('ARG') +
+            _restore_from_frame('LCL') +
+            '@R14\n'
+            'A=M\n'
+            '0;JMP\n')
+
+
+def shared_compare(comparison, continuation_address):
+    """
+    Comparison site: jumps to the routine with the return address in D
+    """
+    routine, _ = COMPARE_ROUTINES[comparison]
+    return ('@{}\n'.format(continuation_address) +
+            'D=A\n' +
+            '@{}\n'.format(routine) +
+            '0;JMP\n' +
+            '({})\n'.format(continuation_address))
+
+
+def compare_routine(comparison):
+    """
+    Replaces the two values on top of the stack with -1 if the comparison
+    holds and 0 otherwise, then jumps back to the address it got in D
+    """
+    routine, jump = COMPARE_ROUTINES[comparison]
+    return ('// shared {} routine\n'.format(comparison) +
+            '({})\n'.format(routine) +
+            '@{}\n'.format(COMPARE_RETURN_ADDRESS) +
+            'M=D\n' +
+            load_stack_head_to_D() +
+            'A=A-1\n'
+            'D=M-D\n'
+            'M=-1\n'
+            '@{}_END\n'.format(routine) +
+            'D;{}\n'.format(jump) +
+            '@SP\n'
+            'A=M-1\n'
+            'M=0\n'
+            '({}_END)\n'.format(routine) +
+            '@{}\n'.format(COMPARE_RETURN_ADDRESS) +
+            'A=M\n'
+            '0;JMP\n')
+
+
+def runtime_routines(shared_calls=False, shared_comparisons=False):
+    """
+    The shared routines the program jumps to, placed after the bootstrap
+    """
+    routines = ''
+    if shared_calls:
+        routines += call_routine() + return_routine()
+    if shared_comparisons:
+        routines += ''.join(compare_routine(comparison)
+                            for comparison in sorted(COMPARE_ROUTINES))
+    return routines
@@ -0,0 +1,144 @@
+"""
+Source maps from translated code back to the VM commands it came from.
+
+A map is a list of entries (position, vm file, vm line, command), sorted by
+position, where each entry covers the positions up to the next one. The
+translator writes positions as `.asm` line numbers to a `.vmmap` file, and
+the assembler turns them into ROM addresses in a `.hackmap` file.
+
+On disk file names and command texts are stored once in a table, and the
+entries as four parallel arrays of deltas against the previous entry, so
+a long run of commands from one file costs a few small ints each.
+"""
+import json
+from bisect import bisect_right
+
+SOURCE_MAP_VERSION = 1
+VM_MAP_EXTENSION = '.vmmap'
+ROM_MAP_EXTENSION = '.hackmap'
+
+ASM_LINES = 'asm lines'
+ROM_ADDRESSES = 'rom addresses'
+
+
+def _deltas(values):
+    previous = 0
+    for value in values:
+        yield value - previous
+        previous = value
+
+
+def _undeltas(deltas):
+    value = 0
+    for delta in deltas:
+        value += delta
+        yield value
+
+
+class SourceMap(object):
+    """
+    `target` says what positions are: ASM_LINES, counted from 1, or
+    ROM_ADDRESSES. `end` is the first position past the last entry.
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self.files = []
+        self.commands = []
+        self.positions = []
+        self.file_indexes = []
+        self.lines = []
+        self.command_indexes = []
+        self.end = 0
+        self._file_index = {}
+        self._command_index = {}
+
+    def _intern(self, table, index, value):
+        if value not in index:
+            index[value] = len(table)
+            table.append(value)
+        return index[value]
+
+    def add(self, position, vm_file, vm_line, command):
+        """
+        Starts an entry at `position`, which must not be before the last one
+        """
+        if self.positions and position < self.positions[-1]:
+            raise Exception('Source map positions must be sorted, '
+                            'got {} after {}'.format(position,
+                                                     self.positions[-1]))
+        self.positions.append(position)
+        self.file_indexes.append(
+            self._intern(self.files, self._file_index, vm_file))
+        self.lines.append(vm_line)
+        self.command_indexes.append(
+            self._intern(self.commands, self._command_index, command))
+
+    def __len__(self):
+        return len(self.positions)
+
+    def entry(self, index):
+        return (self.positions[index], self.files[self.file_indexes[index]],
+                self.lines[index], self.commands[self.command_indexes[index]])
+
+    def lookup(self, position):
+        """
+        Returns (vm file, vm line, command) for a position, or None when no
+        VM command produced it
+        """
+        if position >= self.end:
+            return None
+        index = bisect_right(self.positions, position) - 1
+        if index < 0:
+            return None
+        return self.entry(index)[1:]
+
+    def remap(self, new_positions, target):
+        """
+        Returns a map onto another target, where `new_positions` gives the
+        new position of every old one. Entries left without any position of
+        their own, such as labels that emit no instruction, are dropped.
+        """
+        remapped = SourceMap(target)
+        remapped.end = new_positions(self.end)
+        starts = [new_positions(position) for position in self.positions]
+        for index, start in enumerate(starts):
+            following = (starts[index + 1] if index + 1 < len(starts)
+                         else remapped.end)
+            if start < following:
+                remapped.add(start, *self.entry(index)[1:])
+        return remapped
+
+    def save(self, filename):
+        output = open(filename, 'w')
+        json.dump({
+            'version': SOURCE_MAP_VERSION,
+            'target': self.target,
+            'end': self.end,
+            'files': self.files,
+            'commands': self.commands,
+            'positions': list(_deltas(self.positions)),
+            'file_indexes': list(_deltas(self.file_indexes)),
+            'lines': list(_deltas(self.lines)),
+            'command_indexes': list(_deltas(self.command_indexes))
+        }, output, separators=(',', ':'))
+        output.close()
+
+
+def load_source_map(filename):
+    data = json.load(open(filename))
+    if data['version'] != SOURCE_MAP_VERSION:
+        raise Exception('Unsupported source map version {} in {}'.format(
+            data['version'], filename))
+    source_map = SourceMap(data['target'])
+    source_map.end = data['end']
+    source_map.positions = list(_undeltas(data['positions']))
+    source_map.file_indexes = list(_undeltas(data['file_indexes']))
+    source_map.lines = list(_undeltas(data['lines']))
+    source_map.command_indexes = list(_undeltas(data['command_indexes']))
+    for vm_file in data['files']:
+        source_map._intern(source_map.files, source_map._file_index, vm_file)
+    for command in data['commands']:
+        source_map._intern(source_map.commands, source_map._command_index,
+                           command)
+    return source_map
@@ -0,0 +1,151 @@
+from arithmetic import arithmetic_handler
+from command_types import (
+    ARITHMETIC, CALL, LABEL, FUNCTION, FUSED, GOTO, IF, POP, PUSH, RETURN)
+from fusion import fused_handler
+from helpers import pop_stack_head_to_D, push_D_to_stack
+from memory_access import (CONSTANT, load_segment_to_D,
+                           store_D_to_segment)
+from program_flow import goto_handler, label_handler
+from subroutine import call_handler, function_handler, return_handler
+
+# D op M, with D holding the top of the stack and M the value below it
+BINARY_OPERATIONS = {
+    'add': 'D=D+M',
+    'sub': 'D=M-D',
+    'and': 'D=D&M',
+    'or': 'D=D|M'
+}
+
+UNARY_OPERATIONS = {
+    'neg': '-',
+    'not': '!'
+}
+
+COMPARISON_JUMPS = {
+    'eq': 'JEQ',
+    'gt': 'JGT',
+    'lt': 'JLT'
+}
+
+
+class StackCache(object):
+    """
+    Translates commands keeping the top of the stack in D when it can, so
+    a value pushed by one command and consumed by the next never goes
+    through RAM. While `cached` is True the stack is RAM[SP - 1] and below
+    with D on top of it.
+
+    The cache is flushed to RAM before labels, jumps, function declarations,
+    calls, returns and fused commands, since their code expects the whole
+    stack in RAM
+    """
+
+    def __init__(self, shared_calls=False, shared_comparisons=False):
+        self.shared_calls = shared_calls
+        self.shared_comparisons = shared_comparisons
+        self.cached = False
+        self.label_counter = 0
+
+    def flush(self):
+        """
+        Pushes D to the stack if it holds the top of the stack
+        """
+        if not self.cached:
+            return ''
+        self.cached = False
+        return push_D_to_stack()
+
+    def _top_to_D(self):
+        """
+        Makes D hold the top of the stack, which is popped from RAM
+        """
+        if self.cached:
+            return ''
+        self.cached = True
+        return pop_stack_head_to_D()
+
+    def push(self, segment, index, file):
+        assembly = ('// push {} {} \n'.format(segment, index) +
+                    self.flush())
+        self.cached = True
+        return assembly + load_segment_to_D(segment, index, file)
+
+    def pop(self, segment, index, file):
+        if segment == CONSTANT:
+            raise Exception('Incorrect segment {} for pop command'.format(
+                segment))
+        assembly = ('// pop {} {} \n'.format(segment, index) +
+                    self._top_to_D())
+        self.cached = False
+        return assembly + store_D_to_segment(segment, index, file)
+
+    def arithmetic(self, operation):
+        if operation in UNARY_OPERATIONS:
+            if self.cached:
+                return ('// {} \n'.format(operation) +
+                        'D={}D\n'.format(UNARY_OPERATIONS[operation]))
+            return ('// {} \n'.format(operation) +
+                    '@SP\n' +
+                    'A=M-1\n' +
+                    'M={}M\n'.format(UNARY_OPERATIONS[operation]))
+
+        if operation in COMPARISON_JUMPS and self.shared_comparisons:
+            return self.flush() + arithmetic_handler(operation, True)
+
+        assembly = ('// {} \n'.format(operation) +
+                    self._top_to_D() +
+                    '@SP\n' +
+                    'AM=M-1\n')
+        if operation in BINARY_OPERATIONS:
+            return assembly + BINARY_OPERATIONS[operation] + '\n'
+
+        if operation not in COMPARISON_JUMPS:
+            raise Exception('Invalid arithmetic command {}'.format(operation))
+        true_label = 'CACHED_TRUE_{}'.format(self.label_counter)
+        continue_label = 'CACHED_CONTINUE_{}'.format(self.label_counter)
+        self.label_counter += 1
+        return (assembly +
+                'D=M-D\n' +
+                '@{}\n'.format(true_label) +
+                'D;{}\n'.format(COMPARISON_JUMPS[operation]) +
+                'D=0\n' +
+                '@{}\n'.format(continue_label) +
+                '0;JMP\n' +
+                '({})\n'.format(true_label) +
+                'D=-1\n' +
+                '({})\n'.format(continue_label))
+
+    def if_goto(self, label):
+        assembly = ('// goto handler {}\n'.format(label) +
+                    self._top_to_D())
+        self.cached = False
+        return (assembly +
+                '@{}\n'.format(label) +
+                'D;JNE\n')
+
+    def command(self, command_type, arg1, arg2, file):
+        """
+        Assembly of a command, like `assembly_command_constructor`
+        """
+        if command_type == PUSH:
+            return self.push(arg1, arg2, file)
+        if command_type == POP:
+            return self.pop(arg1, arg2, file)
+        if command_type == ARITHMETIC:
+            return self.arithmetic(arg1)
+        if command_type == IF:
+            return self.if_goto(arg1)
+
+        try:
+            return self.flush() + {
+                GOTO: lambda: goto_handler(arg1),
+                FUNCTION: lambda: function_handler(arg1, arg2),
+                LABEL: lambda: label_handler(arg1),
+                CALL: lambda: call_handler(arg1, arg2, self.shared_calls),
+                RETURN: lambda: return_handler(self.shared_calls),
+                FUSED: lambda: fused_handler(arg1, arg2, file)
+            }[command_type]()
+
+        except KeyError:
+            raise Exception('Invalid command_type {} for '
+                            'StackCache'.format(command_type))
@@ -11,8 +11,8 @@ def stack_initializer():
             'M=D\n')
 
 
-def program_starter():
+def program_starter(shared_calls=False):
     """
     Starts the execution of the program by calling Sys.init
     """
-    return call_handler('Sys.init', '0')
+    return call_handler('Sys.init', '0', shared_calls)
@@ -1,26 +1,30 @@
 from helpers import load_stack_head_to_D, push_D_to_stack
+from memory_access import _push_constant_to_stack
 from program_flow import goto_handler, label_handler
+from runtime import shared_call, shared_return
 
 label_counter = 0
 
 
 def function_handler(function_name, num_locals):
+    # LCL is the stack head on entry, so pushing a 0 for every local both
+    # initializes it and reserves its slot above LCL
     initialize_locals = ''
-    for local in range(int(num_locals)):
+    for _ in range(int(num_locals)):
         initialize_locals += _push_constant_to_stack(0)
-        initialize_locals += _from_stack_to_memory_transporter('LCL',
-                                                               str(local))
 
     return ('// declare {} with locals {}'.format(function_name, num_locals) +
             label_handler(function_name) +
             initialize_locals)
 
 
-def call_handler(function_name, num_args):
+def call_handler(function_name, num_args, shared_calls=False):
     global label_counter
     continuation_address = 'continuation_{}_{}'.format(function_name,
                                                        label_counter)
     label_counter += 1
+    if shared_calls:
+        return shared_call(function_name, num_args, continuation_address)
     return ('// call fn {} with locals {}\n'.format(function_name, num_args) +
             '@{}\n'.format(continuation_address) +
             'D=A\n' +
@@ -54,7 +58,9 @@ def call_handler(function_name, num_args):
             )
 
 
-def return_handler():
+def return_handler(shared_calls=False):
+    if shared_calls:
+        return shared_return()
     frame_address_pointer = 'R13'  # NOQA temp address used to store the base frame address
     continue_address_pointer = 'R14'  # NOQA temp address used to store the address of
     return ('// return\n'
@@ -0,0 +1,291 @@
+"""
+Emulator that runs `.vm` code directly, without translating it to Hack.
+
+Labels and function names are resolved to program counters when the files
+are loaded, and every command becomes a closure over the RAM that executes
+it and returns the next program counter, so a step is a single call.
+"""
+import os
+from array import array
+
+from command_types import (
+    ARITHMETIC, CALL, FUNCTION, GOTO, IF, LABEL, POP, PUSH, RETURN)
+from memory_access import (
+    ARGUMENT, CONSTANT, LOCAL, POINTER, STATIC, TEMP, THAT, THIS)
+from parser import parse_gen
+
+RAM_SIZE = 32768
+SP, LCL, ARG, THIS_POINTER, THAT_POINTER = range(5)
+TEMP_BASE = 5
+POINTER_BASE = 3
+STATIC_BASE = 16
+
+BASE_POINTER_FOR_SEGMENT = {
+    LOCAL: LCL,
+    ARGUMENT: ARG,
+    THIS: THIS_POINTER,
+    THAT: THAT_POINTER
+}
+
+TRUE = 0xFFFF
+FALSE = 0
+
+
+def _signed(value):
+    return value - 0x10000 if value & 0x8000 else value
+
+
+def get_vm_files(path):
+    """
+    A `.vm` file, or every `.vm` file in a directory, sorted
+    """
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, file) for file in os.listdir(path)
+                      if file.endswith('.vm'))
+    return [path]
+
+
+class VMEmulator(object):
+    """
+    Runs the VM commands of one or more `.vm` files on a 32K-word RAM.
+    Execution starts at Sys.init when it is defined, else at the first
+    command, and stops when it runs past the last command.
+    """
+
+    def __init__(self, vm_filenames):
+        self.ram = array('H', [0]) * RAM_SIZE
+        self.static_addresses = {}
+        self.commands = self._load(vm_filenames)
+        self.program = [self._compile(pc, command)
+                        for pc, command in enumerate(self.commands)]
+        end = len(self.program)
+        self.program.append(lambda: end)
+        self.pc = self.functions.get('Sys.init', 0)
+        self.steps = 0
+
+    @property
+    def halted(self):
+        return self.pc == len(self.commands)
+
+    def _load(self, vm_filenames):
+        """
+        Reads every command and records the program counter of each label,
+        scoped to its function, and of each function. Labels are not
+        commands of their own, like in the reference VM emulator, so they
+        point at the command that follows them.
+        """
+        commands = []
+        self.labels = {}
+        self.functions = {}
+        for vm_filename in vm_filenames:
+            file_name = os.path.splitext(os.path.basename(vm_filename))[0]
+            scope = file_name
+            for command_type, arg1, arg2 in parse_gen(vm_filename):
+                if command_type == FUNCTION:
+                    scope = arg1
+                    self.functions[arg1] = len(commands)
+                elif command_type == LABEL:
+                    self.labels[scope, arg1] = len(commands)
+                    continue
+                commands.append((file_name, scope, command_type, arg1, arg2))
+        return commands
+
+    def _label(self, scope, label):
+        try:
+            return self.labels[scope, label]
+        except KeyError:
+            raise Exception('Unknown label {} in {}'.format(label, scope))
+
+    def _static_address(self, file_name, index):
+        key = file_name, index
+        if key not in self.static_addresses:
+            self.static_addresses[key] = (STATIC_BASE +
+                                          len(self.static_addresses))
+        return self.static_addresses[key]
+
+    def _compile(self, pc, command):
+        file_name, scope, command_type, arg1, arg2 = command
+        next_pc = pc + 1
+        if command_type == ARITHMETIC:
+            return self._arithmetic(arg1, next_pc)
+        elif command_type == PUSH:
+            return self._push(arg1, int(arg2), file_name, next_pc)
+        elif command_type == POP:
+            return self._pop(arg1, int(arg2), file_name, next_pc)
+        elif command_type == GOTO:
+            target = self._label(scope, arg1)
+            return lambda: target
+        elif command_type == IF:
+            return self._if_goto(self._label(scope, arg1), next_pc)
+        elif command_type == FUNCTION:
+            return self._function(int(arg2), next_pc)
+        elif command_type == CALL:
+            if arg1 not in self.functions:
+                raise Exception('Unknown function {}'.format(arg1))
+            return self._call(self.functions[arg1], int(arg2), next_pc)
+        elif command_type == RETURN:
+            return self._return()
+        raise Exception('Invalid command_type {}'.format(command_type))
+
+    def _arithmetic(self, operation, next_pc):
+        ram = self.ram
+
+        if operation in ('neg', 'not'):
+            negate = operation == 'neg'
+
+            def unary():
+                top = ram[SP] - 1
+                ram[top] = (-ram[top] if negate else ~ram[top]) & 0xFFFF
+                return next_pc
+            return unary
+
+        compute = {
+            'add': lambda x, y: (x + y) & 0xFFFF,
+            'sub': lambda x, y: (x - y) & 0xFFFF,
+            'and': lambda x, y: x & y,
+            'or': lambda x, y: x | y,
+            'eq': lambda x, y: TRUE if x == y else FALSE,
+            'gt': lambda x, y: TRUE if _signed(x) > _signed(y) else FALSE,
+            'lt': lambda x, y: TRUE if _signed(x) < _signed(y) else FALSE
+        }[operation]
+
+        def binary():
+            top = ram[SP] - 1
+            ram[top - 1] = compute(ram[top - 1], ram[top])
+            ram[SP] = top
+            return next_pc
+        return binary
+
+    def _address(self, segment, index, file_name):
+        """
+        Returns the fixed address of the segment entry, or the base pointer
+        to add the index to for the pointer-based segments
+        """
+        if segment == POINTER:
+            return POINTER_BASE + index, None
+        elif segment == TEMP:
+            return TEMP_BASE + index, None
+        elif segment == STATIC:
+            return self._static_address(file_name, index), None
+        elif segment in BASE_POINTER_FOR_SEGMENT:
+            return None, BASE_POINTER_FOR_SEGMENT[segment]
+        raise Exception('Incorrect segment {}'.format(segment))
+
+    def _push(self, segment, index, file_name, next_pc):
+        ram = self.ram
+
+        if segment == CONSTANT:
+            value = index & 0xFFFF
+
+            def push_constant():
+                top = ram[SP]
+                ram[top] = value
+                ram[SP] = top + 1
+                return next_pc
+            return push_constant
+
+        address, base = self._address(segment, index, file_name)
+        if base is None:
+            def push_fixed():
+                top = ram[SP]
+                ram[top] = ram[address]
+                ram[SP] = top + 1
+                return next_pc
+            return push_fixed
+
+        def push_indexed():
+            top = ram[SP]
+            ram[top] = ram[(ram[base] + index) & 0xFFFF]
+            ram[SP] = top + 1
+            return next_pc
+        return push_indexed
+
+    def _pop(self, segment, index, file_name, next_pc):
+        ram = self.ram
+        if segment == CONSTANT:
+            raise Exception(
+                'Incorrect segment {} for pop command'.format(segment))
+
+        address, base = self._address(segment, index, file_name)
+        if base is None:
+            def pop_fixed():
+                top = ram[SP] - 1
+                ram[address] = ram[top]
+                ram[SP] = top
+                return next_pc
+            return pop_fixed
+
+        def pop_indexed():
+            top = ram[SP] - 1
+            ram[(ram[base] + index) & 0xFFFF] = ram[top]
+            ram[SP] = top
+            return next_pc
+        return pop_indexed
+
+    def _if_goto(self, target, next_pc):
+        ram = self.ram
+
+        def if_goto():
+            top = ram[SP] - 1
+            ram[SP] = top
+            return target if ram[top] else next_pc
+        return if_goto
+
+    def _function(self, num_locals, next_pc):
+        ram = self.ram
+
+        def function():
+            top = ram[SP]
+            for local in range(top, top + num_locals):
+                ram[local] = 0
+            ram[SP] = top + num_locals
+            return next_pc
+        return function
+
+    def _call(self, entry, num_args, next_pc):
+        ram = self.ram
+
+        def call():
+            top = ram[SP]
+            ram[top] = next_pc
+            ram[top + 1] = ram[LCL]
+            ram[top + 2] = ram[ARG]
+            ram[top + 3] = ram[THIS_POINTER]
+            ram[top + 4] = ram[THAT_POINTER]
+            ram[ARG] = top - num_args
+            ram[LCL] = ram[SP] = top + 5
+            return entry
+        return call
+
+    def _return(self):
+        ram = self.ram
+        end = len(self.commands)
+
+        def return_():
+            frame = ram[LCL]
+            return_pc = ram[frame - 5]
+            argument = ram[ARG]
+            ram[argument] = ram[ram[SP] - 1]
+            ram[SP] = argument + 1
+            ram[THAT_POINTER] = ram[frame - 1]
+            ram[THIS_POINTER] = ram[frame - 2]
+            ram[ARG] = ram[frame - 3]
+            ram[LCL] = ram[frame - 4]
+            return return_pc if return_pc < end else end
+        return return_
+
+    def run(self, max_steps):
+        """
+        Executes up to `max_steps` VM commands.
+        Returns the number of commands executed.
+        """
+        program = self.program
+        end = len(self.commands)
+        pc = self.pc
+        steps = 0
+        while steps < max_steps and pc != end:
+            pc = program[pc]()
+            steps += 1
+        self.pc = pc
+        self.steps += steps
+        return steps